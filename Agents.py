@@ -8,9 +8,12 @@ from torch import nn
 import torch.nn.functional as F
 
 from FederatedModel import *
+from Aggregation import aggregate_batch, aggregate_stream, aggregate_buffered
+from Codec import getCodec, UpdateEncoder, decode_update
 from config import *
 
 from log import log
+from profiler import profiler
 
 class FL:
     LossFunc = None
@@ -36,13 +39,27 @@ class FL:
         """
         # Number of total clients
         count = 0
-        def __init__(self, account, model, dataloader):
+        def __init__(self, account, model, data):
             """
             Server must be deployed and contractInfo set before any client initialization.
+            Data is the local dataset of the client as a ClientData.
+            Account can be None for clients that only train, e.g., in worker processes.
             """
             super(FL.Client, self).__init__(account, model)
-            self.dataloader = dataloader
-            account.obtainContract()
+            self.data = data
+            self.datasize = data.size
+            # Standardized local dataset, computed once the global stds are known
+            self.normData = None
+            self.normStats = None
+            # Compresses the local updates, keeps the error feedback of this client
+            self.encoder = None
+            if ENCODE_UPDATES:
+                self.encoder = UpdateEncoder(getCodec(CODEC, TOPK_FRACTION),
+                        model.param_sizes(), DELTA_ENCODING, ERROR_FEEDBACK)
+            # Edge aggregator that commits the updates of this client, if any
+            self.edge = None
+            if account is not None:
+                account.obtainContract()
             self.index = FL.Client.count
             FL.Client.count += 1
 
@@ -51,8 +68,8 @@ class FL:
             Report the local mean values to blockchain.
             Returns a transaction receipt.
             """
-            X = torch.cat([x for x, y in self.dataloader])
-            size = X.shape[0]
+            X = self.data.X
+            size = self.datasize
             mean = X.mean(0, keepdim=True)
             # Commit to blockchain
             tx_receipt = self.account.localMeans(size, mean.numpy().tobytes())
@@ -70,13 +87,28 @@ class FL:
             Report the local std values to blockchain.
             Returns a transaction receipt.
             """
-            X = torch.cat([x for x, y in self.dataloader])
-            size = X.shape[0]
+            X = self.data.X
+            size = self.datasize
             stds = (X - self.means).square().mean(0, keepdim=True)
             # Commit to blockchain
             tx_receipt = self.account.localStds(size, stds.numpy().tobytes())
             return tx_receipt
 
+        def localStats(self):
+            """
+            Report both local means and local variances to blockchain for single-round preprocessing.
+            Variance is computed around the local mean, in float64 for numerical stability.
+            Returns a transaction receipt.
+            """
+            X = self.data.X.double()
+            size = self.datasize
+            mean = X.mean(0, keepdim=True)
+            var = (X - mean).square().mean(0, keepdim=True)
+            data = torch.cat([mean, var]).numpy().astype(FL.Xdtype)
+            # Commit to blockchain
+            tx_receipt = self.account.localStats(size, data.tobytes())
+            return tx_receipt
+
         def getStds(self):
             """
             Get the std values from the blockchain.
@@ -84,29 +116,40 @@ class FL:
             self.stds = torch.tensor(np.frombuffer(self.account.getStds(), dtype=FL.Xdtype).reshape((1, FL.Xfeatures)))
             # Handle 0 stds to avoid division by zero
             self.stds[self.stds == 0.0] = 1.0
+            self.standardize()
 
-        def localUpdate(self):
+        def standardize(self):
             """
-            Perform a local update and trigger an event in blockchain.
-            Returns a transaction receipt.
+            Standardize the local dataset with the global means and stds, and cache it.
+            Cache is recomputed only if the global statistics have changed.
+            """
+            if self.normStats is not None:
+                means, stds = self.normStats
+                if torch.equal(means, self.means) and torch.equal(stds, self.stds):
+                    return
+            self.normData = self.data.standardized(self.means, self.stds)
+            self.normStats = (self.means, self.stds)
+
+        def fetchModel(self):
+            """
+            Get the current epoch and the latest global model bytes from blockchain.
             """
-            # Load the latest model from blockchain
             epoch = self.account.getEpoch()
             modelBytes = self.account.getModel()
-            self.model.from_bytes(modelBytes)
-
-            datasize = 0
-            for X, y in self.dataloader:
-                datasize += X.shape[0]
+            return epoch, modelBytes
 
+        def train(self):
+            """
+            Train the model on the local dataset, starting from its current parameters.
+            Returns the local dataset size and the average training loss.
+            """
             train_loss = 0.0
 
             global LOCAL_EPOCHS, LEARNING_RATE, MOMENTUM
             optimizer = torch.optim.SGD(self.model.parameters(), lr=LEARNING_RATE, momentum=MOMENTUM)
             for i in range(LOCAL_EPOCHS):
-                for batch, (X, y) in enumerate(self.dataloader):
-                    normX = (X - self.means) / self.stds
-                    pred = self.model(normX)
+                for batch, (X, y) in enumerate(self.normData):
+                    pred = self.model(X)
                     loss = FL.LossFunc(pred, y)
                     train_loss += loss.item()
 
@@ -114,16 +157,102 @@ class FL:
                     loss.backward()
                     optimizer.step()
 
-            # len(dataloader) == number of batches
-            loss = train_loss / (len(self.dataloader) * LOCAL_EPOCHS)
+            # len(data) == number of batches
+            loss = train_loss / (len(self.data) * LOCAL_EPOCHS)
+            return self.datasize, loss
+
+        def commitUpdate(self, epoch, datasize, modelBytes, globalBytes):
+            """
+            Commit a trained local model to blockchain.
+            globalBytes is the global model that the local model was trained from,
+            used as the reference in delta encoding.
+            Returns a transaction receipt, or None if the update is sent to an edge aggregator.
+            """
+            if self.edge is not None:
+                return self.edge.collect(epoch, datasize, modelBytes, globalBytes)
+            if self.encoder is not None:
+                modelBytes = self.encoder.encode(
+                        np.frombuffer(modelBytes, dtype=EXTERNAL_DTYPE.numpy),
+                        np.frombuffer(globalBytes, dtype=EXTERNAL_DTYPE.numpy))
+            return self.account.localUpdate(epoch, datasize, modelBytes)
+
+        def localUpdate(self):
+            """
+            Perform a local update and trigger an event in blockchain.
+            Returns a transaction receipt.
+            """
+            # Load the latest model from blockchain
+            with profiler.timer("fetch_model", self.index):
+                epoch, modelBytes = self.fetchModel()
+            with profiler.timer("from_bytes", self.index):
+                self.model.from_bytes(modelBytes)
+
+            with profiler.timer("train", self.index):
+                datasize, loss = self.train()
             log.info(f"FL Client {self.index} local loss: {loss}")
 
             # Commit to blockchain
-            tx_receipt = self.account.localUpdate(epoch, datasize, self.model.to_bytes())
+            with profiler.timer("to_bytes", self.index):
+                updateBytes = self.model.to_bytes()
+            with profiler.timer("commit", self.index):
+                tx_receipt = self.commitUpdate(epoch, datasize, updateBytes, modelBytes)
 
             return tx_receipt
 
 
+    class EdgeAggregator(User):
+        """
+        Edge aggregator collects the local updates of a group of clients off chain, and commits
+        their weighted average as a single local update with the total dataset size of the group.
+        With plain FedAvg the global model is the same as if each client committed its update,
+        up to the rounding of the average to the external dtype.
+        """
+        def __init__(self, account, model, clients):
+            """
+            Account is used to commit the combined updates, e.g., the account of a group member.
+            """
+            super(FL.EdgeAggregator, self).__init__(account, model)
+            self.clients = clients
+            # (epoch, data size, update bytes, global model bytes) of the current round
+            self.updates = []
+            # Updates are encoded only once they are combined
+            self.encoder = None
+            if ENCODE_UPDATES:
+                self.encoder = UpdateEncoder(getCodec(CODEC, TOPK_FRACTION),
+                        model.param_sizes(), DELTA_ENCODING, ERROR_FEEDBACK)
+            for client in clients:
+                client.edge = self
+
+        def collect(self, epoch, datasize, modelBytes, globalBytes):
+            """
+            Receive a trained local model of a client in the group.
+            """
+            self.updates.append((epoch, datasize, modelBytes, globalBytes))
+
+        def commitUpdates(self):
+            """
+            Commit the weighted average of the collected updates to blockchain.
+            Returns a transaction receipt, or None if no client of the group has an update.
+            """
+            if not self.updates:
+                return None
+            epoch, _, _, globalBytes = self.updates[0]
+            assert(all(update[0] == epoch for update in self.updates))
+            totalDataSize = sum(datasize for _, datasize, _, _ in self.updates)
+            with profiler.timer("edge_aggregation"):
+                params = aggregate_batch(
+                        [(datasize, modelBytes) for _, datasize, modelBytes, _ in self.updates],
+                        totalDataSize)
+            self.updates = []
+            modelBytes = params.astype(EXTERNAL_DTYPE.numpy)
+            if self.encoder is not None:
+                updateBytes = self.encoder.encode(modelBytes,
+                        np.frombuffer(globalBytes, dtype=EXTERNAL_DTYPE.numpy))
+            else:
+                updateBytes = modelBytes.tobytes()
+            return self.account.localUpdate(epoch, totalDataSize, updateBytes)
+
+
     class Server(User):
         """
         Federated learning server is the user who performs the model averaging step.
@@ -134,12 +263,18 @@ class FL:
             """
             super(FL.Server, self).__init__(account, model)
             account.deploy(model.to_bytes())
+            # Global models of the recent epochs, which the stale updates were trained from
+            self.history = {}
+            if ASYNC_TRAINING:
+                account.setMaxStaleness(MAX_STALENESS)
+                self.history[0] = self.publishedModel()
 
         def combineMeans(self, receipts):
             """
             Collect local mean report events from the given list of receipts and set global means.
             Returns the transaction receipt.
             """
+            receipts = self.account.waitReceipts(receipts)
             means = combine_means([
                 (n, np.frombuffer(byteMeans, dtype=FL.Xdtype).reshape((1, FL.Xfeatures)))
                 for n, byteMeans in self.account.getMeanEvents(receipts)
@@ -152,6 +287,7 @@ class FL:
             Collect local std report events from the given list of receipts and set global stds.
             Returns the transaction receipt.
             """
+            receipts = self.account.waitReceipts(receipts)
             stds = combine_stds([
                 (n, np.frombuffer(byteMeans, dtype=FL.Xdtype).reshape((1, FL.Xfeatures)))
                 for n, byteMeans in self.account.getStdEvents(receipts)
@@ -159,6 +295,23 @@ class FL:
             tx_receipt = self.account.globalStds(stds.tobytes())
             return tx_receipt
 
+        def combineStats(self, receipts):
+            """
+            Collect local mean and variance report events from the given list of receipts
+            and set both global means and stds in a single transaction.
+            Returns the transaction receipt.
+            """
+            receipts = self.account.waitReceipts(receipts)
+            stats = []
+            for n, byteStats in self.account.getStatsEvents(receipts):
+                data = np.frombuffer(byteStats, dtype=FL.Xdtype).reshape((2, FL.Xfeatures))
+                stats.append((n, data[0:1], data[1:2]))
+            means, stds = combine_stats(stats)
+            tx_receipt = self.account.globalStats(
+                    means.astype(FL.Xdtype).tobytes(),
+                    stds.astype(FL.Xdtype).tobytes())
+            return tx_receipt
+
         def skipPreprocess(self):
             """
             Skips the preprocessing stage by setting the means to 0 and the stds to 1.
@@ -173,21 +326,80 @@ class FL:
             Collect local update events from the given list of receipts and process them.
             Returns the transaction receipt.
             """
+            # Local updates may be still pending
+            with profiler.timer("wait_receipts"):
+                receipts = self.account.waitReceipts(receipts)
             epoch = self.account.getEpoch()
             totalDataSize = self.account.getDataSize()
             log.info(f"Averaging model from {len(receipts)} local update(s)...")
-            self.model.zero()
-            for size, modelBytes in self.account.getUpdateEvents(receipts):
-                # Weight of each update should be proportional to the dataset size
-                weight = size / totalDataSize
-                self.model.federate_from_bytes(modelBytes, weight)
+            events = self.account.getUpdateEvents(receipts)
+            decode = None
+            if ENCODE_UPDATES:
+                # Delta encoded updates are relative to the current global model,
+                # as the clients fetched it in the external dtype
+                sizes = self.model.param_sizes()
+                reference = self.publishedModel()
+                decode = lambda modelBytes: decode_update(modelBytes, sizes, reference)
+            # Weight of each update is proportional to the dataset size
+            # Events are fetched lazily, so this includes event decoding
+            with profiler.timer("aggregation"):
+                if AGGREGATION == "stream":
+                    params = aggregate_stream(events, totalDataSize, decode=decode)
+                else:
+                    params = aggregate_batch(events, totalDataSize, decode=decode)
+            if params is None:
+                log.warning("No valid local updates, keeping the current model")
+            else:
+                self.model.from_numpy(params)
             # Model is now ready
             # Update model on blockchain
-            tx_receipt = self.account.globalUpdate(self.model.to_bytes())
+            with profiler.timer("global_update"):
+                tx_receipt = self.account.globalUpdate(self.model.to_bytes())
             log.info(f"Epoch {epoch} finished and committed to blockchain.")
 
             return tx_receipt
 
+        def publishedModel(self):
+            """
+            The global model as clients see it after fetching it, as a float64 vector.
+            """
+            return np.frombuffer(self.model.to_bytes(), dtype=EXTERNAL_DTYPE.numpy).astype(np.float64)
+
+        def aggregateBuffered(self, receipts):
+            """
+            Aggregate the buffered updates of asynchronous training, which may be trained from
+            older global models. Updates are weighted by dataset size and down-weighted by staleness.
+            Returns the transaction receipt.
+            """
+            with profiler.timer("wait_receipts"):
+                receipts = self.account.waitReceipts(receipts)
+            epoch = self.account.getEpoch()
+            updates = []
+            for updateEpoch, size, modelBytes in self.account.getBufferedUpdates(receipts):
+                if updateEpoch not in self.history:
+                    log.warning(f"Ignoring update of epoch {updateEpoch} older than the staleness window")
+                    continue
+                updates.append((updateEpoch, size, modelBytes))
+            log.info(f"Aggregating {len(updates)} buffered update(s)...")
+            decode = None
+            if ENCODE_UPDATES:
+                sizes = self.model.param_sizes()
+                # Delta encoded updates are relative to the model they were trained from
+                decode = lambda modelBytes, base: decode_update(modelBytes, sizes, base)
+            with profiler.timer("aggregation"):
+                params = aggregate_buffered(updates, epoch, self.history, STALENESS_EXPONENT, decode=decode)
+            if params is None:
+                log.warning("No valid local updates, keeping the current model")
+            else:
+                self.model.from_numpy(params)
+            with profiler.timer("global_update"):
+                tx_receipt = self.account.globalUpdate(self.model.to_bytes())
+            self.history[epoch + 1] = self.publishedModel()
+            for old in [e for e in self.history if e < epoch + 1 - MAX_STALENESS]:
+                del self.history[old]
+            log.info(f"Epoch {epoch} finished and committed to blockchain.")
+            return tx_receipt
+
         def getModel(self):
             modelBytes = self.account.getModel()
             self.model.from_bytes(modelBytes)
@@ -0,0 +1,126 @@
+"""
+Weighted model averaging over serialized local updates.
+"""
+import numpy as np
+
+from config import *
+
+
+def decode_updates(events, dtype=None, decode=None):
+    """
+    Given an iterable of (size, modelBytes) tuples, decode all updates at once.
+    If decode is given, it's used to decode each update to a flat array,
+    otherwise updates are raw parameters in EXTERNAL_DTYPE or the given dtype.
+    Returns the sizes as a vector and the updates as a (clients x params) matrix.
+    """
+    dtype = EXTERNAL_DTYPE.numpy if dtype is None else dtype
+    sizes = []
+    blobs = []
+    for size, modelBytes in events:
+        sizes.append(size)
+        blobs.append(modelBytes if decode is None else decode(modelBytes))
+    if not blobs:
+        return np.zeros(0), None
+    if decode is not None:
+        matrix = np.stack(blobs)
+    else:
+        # A single join and frombuffer instead of one decode per update
+        matrix = np.frombuffer(b''.join(blobs), dtype=dtype).reshape((len(blobs), -1))
+    return np.array(sizes, dtype=np.float64), matrix
+
+
+def aggregate_batch(events, totalDataSize, dtype=None, decode=None):
+    """
+    Weighted average of all updates with a single matrix-vector product.
+    Weight of each update is proportional to its dataset size.
+    Returns a float64 parameter vector, or None if there are no updates.
+    """
+    sizes, matrix = decode_updates(events, dtype, decode)
+    if matrix is None:
+        return None
+    weights = sizes / totalDataSize
+    return weights @ matrix.astype(np.float64)
+
+
+class StreamingAggregator:
+    """
+    Folds updates into a float64 accumulator as they arrive.
+    Only a single update is decoded at a time, so the memory usage doesn't depend on
+    the number of clients.
+    """
+    def __init__(self, totalDataSize, dtype=None, decode=None):
+        self.totalDataSize = totalDataSize
+        self.dtype = EXTERNAL_DTYPE.numpy if dtype is None else dtype
+        self.decode = decode
+        self.total = None
+        self.count = 0
+
+    def add(self, size, modelBytes):
+        """
+        Add a single serialized update with the given dataset size.
+        """
+        if self.decode is not None:
+            update = self.decode(modelBytes)
+        else:
+            update = np.frombuffer(modelBytes, dtype=self.dtype)
+        if self.total is None:
+            self.total = np.zeros(update.size, dtype=np.float64)
+            self.buffer = np.empty(update.size, dtype=np.float64)
+        weight = size / self.totalDataSize
+        # Reuse the same buffer instead of allocating temporaries for each update,
+        # multiplying in float64 like aggregate_batch rather than in the update dtype
+        np.multiply(update, weight, out=self.buffer, dtype=np.float64)
+        self.total += self.buffer
+        self.count += 1
+
+    def result(self):
+        """
+        Returns the accumulated float64 parameter vector, or None if there are no updates.
+        """
+        return self.total
+
+
+def aggregate_stream(events, totalDataSize, dtype=None, decode=None):
+    """
+    Weighted average of the updates by folding them into an accumulator one by one.
+    Returns a float64 parameter vector, or None if there are no updates.
+    """
+    aggregator = StreamingAggregator(totalDataSize, dtype, decode)
+    for size, modelBytes in events:
+        aggregator.add(size, modelBytes)
+    return aggregator.result()
+
+
+def staleness_weight(staleness, exponent):
+    """
+    Polynomial down-weighting of stale updates, (1 + staleness)^-exponent.
+    """
+    return (1.0 + staleness) ** -exponent
+
+
+def aggregate_buffered(events, epoch, bases, exponent, dtype=None, decode=None):
+    """
+    Staleness-weighted aggregation of buffered asynchronous updates, as in FedBuff.
+    Events are (epoch, size, modelBytes) tuples, bases maps each epoch to the float64 global
+    model that the updates of that epoch were trained from.
+    Each update adds its difference from its base to the current global model, weighted by
+    its dataset size and staleness_weight. Without staleness this is the same as FedAvg.
+    If decode is given, it's called with the update bytes and the base of the update.
+    Returns a float64 parameter vector, or None if there are no updates.
+    """
+    dtype = EXTERNAL_DTYPE.numpy if dtype is None else dtype
+    delta = None
+    totalDataSize = 0
+    for updateEpoch, size, modelBytes in events:
+        base = bases[updateEpoch]
+        if decode is None:
+            update = np.frombuffer(modelBytes, dtype=dtype)
+        else:
+            update = decode(modelBytes, base)
+        if delta is None:
+            delta = np.zeros(base.size, dtype=np.float64)
+        delta += (size * staleness_weight(epoch - updateEpoch, exponent)) * (update - base)
+        totalDataSize += size
+    if delta is None:
+        return None
+    return bases[epoch] + delta / totalDataSize
@@ -0,0 +1,80 @@
+"""
+Asynchronous buffered federated learning, as in FedBuff.
+Clients train at their own pace from whatever global model is current when they start,
+and the server aggregates as soon as enough updates are buffered, without waiting for
+the slowest clients of a round.
+Client speeds are simulated: training runs immediately in this process, and a simulated
+clock decides the order in which the updates are committed.
+Random state is taken from numpy and random, which are seeded in config.
+"""
+import heapq
+import random
+import numpy as np
+
+from config import *
+
+from log import log
+from profiler import profiler
+
+
+class AsyncTraining:
+    def __init__(self, server, clients):
+        """
+        Start training on a fraction of the clients, which is kept training concurrently.
+        """
+        self.server = server
+        self.clients = clients
+        # Simulated training time per local sample of each client
+        self.speeds = np.random.lognormal(0.0, SPEED_SIGMA, len(clients))
+        self.time = 0.0
+        # (finish time, client index, epoch, data size, update bytes, global model bytes)
+        self.running = []
+        concurrency = max(1, round(TRAINING_FRACTION * len(clients)))
+        for index in random.sample(range(len(clients)), concurrency):
+            self.start(index)
+
+    def start(self, index):
+        """
+        Fetch the current global model and train the client on it. The update is
+        committed when the simulated training time of the client has passed.
+        """
+        client = self.clients[index]
+        with profiler.timer("fetch_model", index):
+            epoch, modelBytes = client.fetchModel()
+        with profiler.timer("from_bytes", index):
+            client.model.from_bytes(modelBytes)
+        with profiler.timer("train", index):
+            datasize, loss = client.train()
+        log.info(f"FL Client {index} local loss: {loss}")
+        with profiler.timer("to_bytes", index):
+            updateBytes = client.model.to_bytes()
+        finish = self.time + self.speeds[index] * datasize
+        heapq.heappush(self.running, (finish, index, epoch, datasize, updateBytes, modelBytes))
+
+    def startIdle(self):
+        """
+        Start training on a random client that is not training.
+        """
+        busy = {entry[1] for entry in self.running}
+        idle = [index for index in range(len(self.clients)) if index not in busy]
+        if idle:
+            self.start(random.choice(idle))
+
+    def step(self):
+        """
+        Commit the updates of the clients that finish first until the buffer is full,
+        and aggregate them into the next global model.
+        Returns the transaction receipt of the global update.
+        """
+        receipts = []
+        while len(receipts) < BUFFER_SIZE:
+            self.time, index, epoch, datasize, updateBytes, modelBytes = heapq.heappop(self.running)
+            client = self.clients[index]
+            staleness = client.account.getEpoch() - epoch
+            if staleness > MAX_STALENESS:
+                log.warning(f"FL Client {index} dropped its update of epoch {epoch}, {staleness} epochs stale")
+            else:
+                with profiler.timer("commit", index):
+                    receipts.append(client.commitUpdate(epoch, datasize, updateBytes, modelBytes))
+            self.startIdle()
+        return self.server.aggregateBuffered(receipts)
@@ -0,0 +1,121 @@
+"""
+Trains many clients together as a single batched tensor program.
+Intended for small models, where Python and DataLoader overhead dominates the
+training time of FL.Client.localUpdate.
+"""
+import torch
+import torch.nn.functional as F
+from time import perf_counter
+from torch.func import functional_call, vmap, grad_and_value
+
+from config import *
+
+from log import log
+from profiler import profiler
+
+
+class BatchedClients:
+    """
+    Stacks the parameters of the selected clients along a new client dimension and
+    performs the local SGD steps of all clients at once.
+    Each client still sees its own minibatches. Shorter datasets are padded and masked,
+    and a client whose epoch has ended doesn't take a step.
+    This gives the same per-client updates as the sequential path up to the random
+    shuffling order.
+
+    Only models without buffers or random layers (e.g. dropout) are supported.
+    Loss function is cross entropy, same as FL.LossFunc.
+    """
+    def __init__(self, model):
+        """
+        Model is used as a template for functional calls and for serializing the updates.
+        """
+        self.model = model
+        self.names = [name for name, _ in model.named_parameters()]
+
+        def loss(params, X, y, mask):
+            pred = functional_call(self.model, params, (X,))
+            losses = F.cross_entropy(pred, y, reduction='none')
+            # Mean over the valid samples of the batch
+            return (losses * mask).sum() / mask.sum().clamp(min=1)
+        self.step = vmap(grad_and_value(loss))
+
+    def stackParams(self, models):
+        """
+        Given a list of flat parameter vectors, returns a dict of stacked parameter tensors.
+        """
+        stacked = torch.stack(models)
+        params = {}
+        offset = 0
+        for name, param in self.model.named_parameters():
+            size = param.numel()
+            params[name] = stacked[:, offset:offset+size].reshape((len(models),) + param.shape)
+            offset += size
+        return params
+
+    def localUpdates(self, clients):
+        """
+        Perform the local updates of the given clients together.
+        Returns the transaction receipts in the same order as clients.
+        """
+        global LOCAL_EPOCHS, LEARNING_RATE, MOMENTUM, BATCH_SIZE
+        C = len(clients)
+        epochs = []
+        globalModels = []
+        models = []
+        for client in clients:
+            with profiler.timer("fetch_model", client.index):
+                epoch, modelBytes = client.fetchModel()
+            epochs.append(epoch)
+            globalModels.append(modelBytes)
+            self.model.from_bytes(modelBytes)
+            models.append(torch.cat([p.detach().reshape(-1) for p in self.model.parameters()]))
+        params = self.stackParams(models)
+
+        # Training of all clients together, not attributed to any of them
+        startTime = perf_counter()
+        # Pad the local datasets to the same length
+        data = [(client.normData.X, client.normData.y) for client in clients]
+        sizes = torch.tensor([client.datasize for client in clients])
+        maxSize = int(sizes.max())
+        X = torch.zeros((C, maxSize, data[0][0].shape[1]), dtype=data[0][0].dtype)
+        y = torch.zeros((C, maxSize), dtype=data[0][1].dtype)
+        for i, (cX, cy) in enumerate(data):
+            X[i, :cX.shape[0]] = cX
+            y[i, :cy.shape[0]] = cy
+
+        batches = (sizes + BATCH_SIZE - 1) // BATCH_SIZE
+        steps = int(batches.max())
+        clientRange = torch.arange(C).unsqueeze(1)
+        momentum = {name: torch.zeros_like(p) for name, p in params.items()}
+        train_loss = torch.zeros(C, dtype=torch.float64)
+        for _ in range(LOCAL_EPOCHS):
+            # Random permutation of each client's own samples, padded at the end
+            order = torch.zeros((C, steps * BATCH_SIZE), dtype=torch.long)
+            valid = torch.arange(steps * BATCH_SIZE).unsqueeze(0) < sizes.unsqueeze(1)
+            for i in range(C):
+                order[i, :sizes[i]] = torch.randperm(int(sizes[i]))
+            for s in range(steps):
+                index = order[:, s*BATCH_SIZE:(s+1)*BATCH_SIZE]
+                mask = valid[:, s*BATCH_SIZE:(s+1)*BATCH_SIZE].to(X.dtype)
+                active = s < batches
+                grads, losses = self.step(params, X[clientRange, index], y[clientRange, index], mask)
+                train_loss += torch.where(active, losses.detach(), 0.0)
+                for name in self.names:
+                    shape = (C,) + (1,) * (params[name].dim() - 1)
+                    gate = active.view(shape)
+                    # SGD with momentum, same as torch.optim.SGD without dampening
+                    buf = torch.where(gate, MOMENTUM * momentum[name] + grads[name], momentum[name])
+                    momentum[name] = buf
+                    params[name] = torch.where(gate, params[name] - LEARNING_RATE * buf, params[name])
+
+        train_loss /= batches * LOCAL_EPOCHS
+        profiler.add("train", perf_counter() - startTime)
+        receipts = []
+        for i, client in enumerate(clients):
+            log.info(f"FL Client {client.index} local loss: {train_loss[i].item()}")
+            for name, param in self.model.named_parameters():
+                param.detach().copy_(params[name][i])
+            with profiler.timer("commit", client.index):
+                receipts.append(client.commitUpdate(epochs[i], int(sizes[i]), self.model.to_bytes(), globalModels[i]))
+        return receipts
@@ -0,0 +1,211 @@
+"""
+Benchmark suite of the federated learning pipeline.
+Measures model serialization, standardization helpers, aggregation, local training throughput
+and the wall-clock time of full rounds on the given platforms, and writes the results as JSON
+so that runs can be compared across commits.
+
+Usage: python Benchmark.py [config.ini] [output.json]
+
+External dtype is read by every module at import time, so each (platform, dtype) pair runs
+in its own process with a derived config file.
+"""
+import sys
+import os
+import json
+import time
+import tempfile
+import subprocess
+import platform as host
+from configparser import ConfigParser
+from datetime import datetime
+
+# Sweeps
+platforms = ["dummy", "eth"]
+externalDtypes = [16, 32, 64]
+# Hidden layer sizes of the SingleLayer model
+neuronCounts = [16, 256, 4096]
+userCounts = [2, 5, 10]
+numFeatures = 64
+numLabels = 10
+samplesPerUser = 1000
+# Timings are the median of this many repeats
+repeats = 5
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def measure(func, repeat=repeats):
+    """
+    Returns the median wall-clock time of the function in seconds.
+    """
+    times = []
+    for i in range(repeat):
+        startTime = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - startTime)
+    return median(times)
+
+
+def benchmarkModel(neuronCount):
+    """
+    Benchmark serialization and aggregation of a model of the given size, and full rounds
+    with different numbers of users. Runs in a worker process with the derived config.
+    """
+    import numpy as np
+    import torch
+    from torch import nn
+    from Agents import FL
+    from FederatedModel import combine_means, combine_stds
+    from dataset import ClientData
+    import ModelConfig
+    from config import (PLATFORM_NAME, INTERNAL_DTYPE, FLAT_PARAMETERS, BATCH_SIZE,
+            LOCAL_EPOCHS, RANDOM_SEED)
+
+    if PLATFORM_NAME == "eth":
+        from EthPlatform import EthPlatform as Platform
+    else:
+        from DummyPlatform import DummyPlatform as Platform
+
+    args = ConfigParser()
+    args.read_dict({"MODEL": {"neuron count": str(neuronCount)}})
+    def buildModel():
+        torch.manual_seed(RANDOM_SEED)
+        model = ModelConfig.SingleLayer(numFeatures, numLabels, args["MODEL"])
+        model.to(INTERNAL_DTYPE.torch)
+        if FLAT_PARAMETERS:
+            model.flatten()
+        return model
+
+    model = buildModel()
+    other = buildModel()
+    modelBytes = model.to_bytes()
+    result = {
+        "neuron_count": neuronCount,
+        "parameters": sum(model.param_sizes()),
+        "model_bytes": len(modelBytes),
+        "to_bytes": measure(model.to_bytes),
+        "from_bytes": measure(lambda: other.from_bytes(modelBytes)),
+        "federate_from_bytes": measure(lambda: other.federate_from_bytes(modelBytes, 0.5)),
+        "users": [],
+    }
+
+    FL.LossFunc = nn.CrossEntropyLoss()
+    FL.Xfeatures = numFeatures
+    for userCount in userCounts:
+        accounts = Platform.initAccounts(userCount + 1)
+        if len(accounts) < userCount + 1:
+            break
+        rng = np.random.default_rng(RANDOM_SEED)
+        datasets = [
+                ClientData(
+                    torch.tensor(rng.standard_normal((samplesPerUser, numFeatures)), dtype=INTERNAL_DTYPE.torch),
+                    torch.tensor(rng.integers(0, numLabels, samplesPerUser)),
+                    BATCH_SIZE)
+                for i in range(userCount)]
+        reports = [
+                (samplesPerUser, rng.standard_normal((1, numFeatures)).astype(FL.Xdtype))
+                for i in range(userCount)]
+
+        server = FL.Server(accounts[-1], buildModel())
+        localModel = buildModel()
+        clients = [FL.Client(accounts[i], localModel, data) for i, data in enumerate(datasets)]
+        server.skipPreprocess()
+        for client in clients:
+            client.getMeans()
+            client.getStds()
+
+        trainTime = measure(clients[0].train, 1)
+        roundTime = measure(lambda: server.averageUpdates(
+            [client.localUpdate() for client in clients]), 1)
+        # Aggregation alone, on the updates of a round that is not committed
+        epoch = server.account.getEpoch()
+        receipts = [client.commitUpdate(epoch, client.datasize, modelBytes, modelBytes) for client in clients]
+        result["users"].append({
+            "users": userCount,
+            "combine_means": measure(lambda: combine_means(reports)),
+            "combine_stds": measure(lambda: combine_stds(reports)),
+            "average_updates": measure(lambda: server.averageUpdates(receipts), 1),
+            "train_samples_per_second": clients[0].datasize * LOCAL_EPOCHS / trainTime,
+            "round": roundTime,
+        })
+    return result
+
+
+def worker(output):
+    """
+    Run the benchmarks with the current config and write them to the output file.
+    """
+    from log import log
+    import logging
+    # Per-client training logs would dominate the output
+    log.setLevel(logging.WARNING)
+    results = [benchmarkModel(neuronCount) for neuronCount in neuronCounts]
+    with open(output, 'w') as f:
+        json.dump(results, f)
+
+
+def gitCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def driver(configFilename, output):
+    """
+    Run a worker for each platform and external dtype, and collect the results.
+    """
+    runs = []
+    for platformName in platforms:
+        for dtype in externalDtypes:
+            config = ConfigParser()
+            config.read(configFilename)
+            config["FL"]["platform"] = platformName
+            config["DATATYPES"]["external"] = str(dtype)
+            fd, configPath = tempfile.mkstemp(suffix=".ini")
+            with os.fdopen(fd, 'w') as f:
+                config.write(f)
+            resultPath = configPath + ".json"
+            print(f"Benchmarking platform {platformName} with external dtype float{dtype}")
+            run = {"platform": platformName, "external_dtype": dtype}
+            try:
+                process = subprocess.run(
+                        [sys.executable, __file__, configPath, "--worker", resultPath],
+                        capture_output=True, text=True)
+                if process.returncode == 0:
+                    with open(resultPath, 'r') as f:
+                        run["models"] = json.load(f)
+                else:
+                    # e.g. solc is not installed for the Ethereum platform
+                    lines = process.stderr.strip().splitlines()
+                    run["error"] = lines[-1] if lines else f"exit code {process.returncode}"
+                    print(f"\tFailed: {run['error']}")
+            finally:
+                os.remove(configPath)
+                if os.path.exists(resultPath):
+                    os.remove(resultPath)
+            runs.append(run)
+
+    with open(output, 'w') as f:
+        json.dump({
+            "date": datetime.now().isoformat(),
+            "commit": gitCommit(),
+            "python": host.python_version(),
+            "machine": host.machine(),
+            "config": configFilename,
+            "runs": runs,
+            }, f, indent = 4)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 4 and sys.argv[2] == "--worker":
+        worker(sys.argv[3])
+    else:
+        configFilename = "config.ini" if len(sys.argv) < 2 else sys.argv[1]
+        output = "benchmark.json" if len(sys.argv) < 3 else sys.argv[2]
+        driver(configFilename, output)
@@ -0,0 +1,61 @@
+"""
+Off-chain content-addressed storage for model blobs.
+Only the commitment of a blob, i.e., its SHA-256 hash and size, is written on blockchain.
+"""
+import os
+import hashlib
+
+from util import atomic_write
+
+
+# 32 bytes of SHA-256 hash followed by 8 bytes of big endian size
+COMMITMENT_SIZE = 40
+
+
+def make_commitment(digest: bytes, size: int) -> bytes:
+    return digest + size.to_bytes(8, "big")
+
+
+def parse_commitment(commitment: bytes):
+    """
+    Returns the (digest, size) tuple in the given commitment.
+    """
+    if len(commitment) != COMMITMENT_SIZE:
+        raise ValueError(f"Invalid blob commitment of {len(commitment)} bytes")
+    return commitment[:32], int.from_bytes(commitment[32:], "big")
+
+
+class BlobStore:
+    """
+    Stores blobs in a local directory, one file per blob, named after its hash.
+    Stands in for a shared off-chain storage such as IPFS.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest: bytes):
+        return os.path.join(self.directory, digest.hex())
+
+    def put(self, data: bytes) -> bytes:
+        """
+        Store the given blob and return its commitment.
+        """
+        digest = hashlib.sha256(data).digest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            # Readers never see a partial blob
+            with atomic_write(path) as f:
+                f.write(data)
+        return make_commitment(digest, len(data))
+
+    def get(self, commitment: bytes) -> bytes:
+        """
+        Fetch the blob with the given commitment and verify it.
+        """
+        digest, size = parse_commitment(commitment)
+        with open(self.path(digest), 'rb') as f:
+            data = f.read()
+        if len(data) != size or hashlib.sha256(data).digest() != digest:
+            raise ValueError(f"Blob {digest.hex()} doesn't match its commitment")
+        return data
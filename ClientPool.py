@@ -0,0 +1,90 @@
+"""
+Process pool for training the selected clients of a round in parallel.
+"""
+import numpy as np
+import torch
+from concurrent.futures import ProcessPoolExecutor
+
+from Agents import FL
+from config import *
+
+from log import log
+from profiler import profiler
+
+
+# Per-process state of the worker, set by the initializer.
+# Each worker has its own model instance and its own clients.
+_workerClients = None
+
+
+def _initWorker(model, lossFunc, numFeatures, clientData, means, stds):
+    global _workerClients
+    # Workers are already parallel, avoid oversubscribing the cores
+    torch.set_num_threads(1)
+    if FLAT_PARAMETERS:
+        model.flatten()
+    FL.LossFunc = lossFunc
+    FL.Xfeatures = numFeatures
+    FL.Client.count = 0
+    _workerClients = []
+    for data in clientData:
+        client = FL.Client(None, model, data)
+        client.means = means
+        client.stds = stds
+        client.standardize()
+        _workerClients.append(client)
+
+
+def _trainWorker(index, modelBytes, seed):
+    client = _workerClients[index]
+    torch.manual_seed(seed)
+    client.model.from_bytes(modelBytes)
+    datasize, loss = client.train()
+    return datasize, client.model.to_bytes(), loss
+
+
+class ClientPool:
+    """
+    Runs the local training of clients in worker processes.
+    Reading the model from and committing the updates to blockchain still happen
+    in the main process, in the given order of the clients.
+    """
+    def __init__(self, workers, model, clientData, means, stds):
+        """
+        Start the given number of workers.
+        Model is copied to each worker, clientData must be in the same order as client indices.
+        """
+        self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_initWorker,
+                initargs=(model, FL.LossFunc, FL.Xfeatures, clientData, means, stds))
+
+    def localUpdates(self, clients):
+        """
+        Perform the local updates of the given clients in parallel.
+        Returns the transaction receipts in the same order as clients.
+        """
+        jobs = []
+        for client in clients:
+            with profiler.timer("fetch_model", client.index):
+                epoch, modelBytes = client.fetchModel()
+            # Seed depends only on the client and the epoch, not on the scheduling
+            seed = int(np.random.SeedSequence([RANDOM_SEED, epoch, client.index]).generate_state(1)[0])
+            future = self.executor.submit(_trainWorker, client.index, modelBytes, seed)
+            jobs.append((client, epoch, modelBytes, future))
+
+        receipts = []
+        for client, epoch, modelBytes, future in jobs:
+            # Time spent waiting for the worker, training overlaps with other clients
+            with profiler.timer("train", client.index):
+                datasize, updateBytes, loss = future.result()
+            log.info(f"FL Client {client.index} local loss: {loss}")
+            with profiler.timer("commit", client.index):
+                receipts.append(client.commitUpdate(epoch, datasize, updateBytes, modelBytes))
+        return receipts
+
+    def shutdown(self):
+        """
+        Stop the workers. Jobs that have not started, e.g. after a failed round, are cancelled.
+        """
+        self.executor.shutdown(cancel_futures=True)
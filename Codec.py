@@ -0,0 +1,206 @@
+"""
+Compression codecs for the local updates that clients post on blockchain.
+Every encoded update starts with a single header byte: the lower 7 bits are the codec id
+and the highest bit is set if the update is delta encoded against the global model.
+So the server can decode each update without knowing how it was encoded.
+Parameters are handled as flat vectors, sizes of the parameter tensors are needed for
+per-tensor scales.
+"""
+import numpy as np
+
+from config import *
+
+
+DELTA_FLAG = 0x80
+
+
+class Codec:
+    """
+    Base class of the codecs. Encodes a flat float vector to bytes and back.
+    """
+    id = None
+    name = None
+
+    def encode(self, x: np.ndarray, sizes: list) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, body: bytes, sizes: list) -> np.ndarray:
+        raise NotImplementedError
+
+
+class FloatCodec(Codec):
+    """
+    No compression, parameters in EXTERNAL_DTYPE.
+    """
+    id = 0
+    name = "float"
+
+    def encode(self, x, sizes):
+        return x.astype(EXTERNAL_DTYPE.numpy).tobytes()
+
+    def decode(self, body, sizes):
+        return np.frombuffer(body, dtype=EXTERNAL_DTYPE.numpy).astype(np.float64)
+
+
+class QuantizationCodec(Codec):
+    """
+    Symmetric per-tensor quantization to signed integers with the given number of bits.
+    Each tensor is stored as a float32 scale followed by its quantized values.
+    4-bit values are packed two per byte.
+    """
+    def __init__(self, bits):
+        self.bits = bits
+        self.levels = 2 ** (bits - 1) - 1
+        self.id = {8: 1, 4: 2}[bits]
+        self.name = f"int{bits}"
+
+    def encode(self, x, sizes):
+        chunks = []
+        offset = 0
+        for size in sizes:
+            t = x[offset:offset+size]
+            offset += size
+            scale = np.abs(t).max() / self.levels if size else 0.0
+            if scale == 0.0:
+                scale = 1.0
+            q = np.clip(np.rint(t / scale), -self.levels, self.levels).astype(np.int8)
+            chunks.append(np.float32(scale).tobytes())
+            chunks.append(self.pack(q))
+        return b''.join(chunks)
+
+    def decode(self, body, sizes):
+        x = np.empty(sum(sizes), dtype=np.float64)
+        offset = 0
+        position = 0
+        for size in sizes:
+            scale = np.frombuffer(body, dtype=np.float32, count=1, offset=position)[0]
+            position += 4
+            nbytes = self.packed_size(size)
+            q = self.unpack(np.frombuffer(body, dtype=np.int8, count=nbytes, offset=position), size)
+            position += nbytes
+            x[offset:offset+size] = q * np.float64(scale)
+            offset += size
+        assert(position == len(body))
+        return x
+
+    def packed_size(self, size):
+        return size if self.bits == 8 else (size + 1) // 2
+
+    def pack(self, q):
+        if self.bits == 8:
+            return q.tobytes()
+        if q.size % 2:
+            q = np.append(q, np.int8(0))
+        # Two's complement nibbles, low nibble first
+        u = (q.astype(np.uint8) & 0x0F)
+        return (u[0::2] | (u[1::2] << 4)).tobytes()
+
+    def unpack(self, packed, size):
+        if self.bits == 8:
+            return packed
+        u = packed.view(np.uint8)
+        q = np.empty(u.size * 2, dtype=np.int8)
+        q[0::2] = (u & 0x0F).astype(np.int8)
+        q[1::2] = (u >> 4).astype(np.int8)
+        # Sign extend 4-bit values
+        q[q > 7] -= 16
+        return q[:size]
+
+
+class TopKCodec(Codec):
+    """
+    Top-k sparsification: only the given fraction of the entries with the largest
+    magnitudes are sent, as uint32 indices followed by EXTERNAL_DTYPE values.
+    Only meaningful with delta encoding.
+    """
+    id = 3
+    name = "topk"
+
+    def __init__(self, fraction):
+        self.fraction = fraction
+
+    def select(self, x):
+        """
+        Indices of the entries to send, in increasing order.
+        """
+        k = max(1, int(np.ceil(self.fraction * x.size)))
+        if k >= x.size:
+            return np.arange(x.size, dtype=np.uint32)
+        return np.sort(np.argpartition(np.abs(x), -k)[-k:]).astype(np.uint32)
+
+    def encode(self, x, sizes):
+        indices = self.select(x)
+        values = x[indices].astype(EXTERNAL_DTYPE.numpy)
+        return np.uint32(indices.size).tobytes() + indices.tobytes() + values.tobytes()
+
+    def decode(self, body, sizes):
+        k = int(np.frombuffer(body, dtype=np.uint32, count=1)[0])
+        indices = np.frombuffer(body, dtype=np.uint32, count=k, offset=4)
+        values = np.frombuffer(body, dtype=EXTERNAL_DTYPE.numpy, count=k, offset=4 + 4*k)
+        x = np.zeros(sum(sizes), dtype=np.float64)
+        x[indices] = values
+        return x
+
+
+def getCodec(name: str, topkFraction=0.01):
+    """
+    Build a codec from its name in the config file.
+    """
+    if name == "float":
+        return FloatCodec()
+    elif name == "int8":
+        return QuantizationCodec(8)
+    elif name == "int4":
+        return QuantizationCodec(4)
+    elif name == "topk":
+        return TopKCodec(topkFraction)
+    else:
+        raise ValueError(f"Unknown codec: {name}")
+
+
+CODECS = {codec.id: codec for codec in [
+    FloatCodec(), QuantizationCodec(8), QuantizationCodec(4), TopKCodec(1.0),
+    ]}
+
+
+class UpdateEncoder:
+    """
+    Client side of a codec.
+    Keeps the error feedback residual of the client: the part of the update that was lost
+    in compression is added to the next update, so that it's eventually sent.
+    """
+    def __init__(self, codec: Codec, sizes: list, delta: bool, errorFeedback: bool):
+        self.codec = codec
+        self.sizes = sizes
+        self.delta = delta
+        self.errorFeedback = errorFeedback
+        self.residual = None
+
+    def encode(self, params: np.ndarray, reference: np.ndarray) -> bytes:
+        """
+        Encode the flat parameters of the local model.
+        Reference is the global model the update was trained from, used in delta encoding.
+        """
+        x = params.astype(np.float64)
+        if self.delta:
+            x -= reference
+        if self.errorFeedback and self.residual is not None:
+            x += self.residual
+        body = self.codec.encode(x, self.sizes)
+        if self.errorFeedback:
+            self.residual = x - self.codec.decode(body, self.sizes)
+        header = self.codec.id | (DELTA_FLAG if self.delta else 0)
+        return bytes([header]) + body
+
+
+def decode_update(bytestr: bytes, sizes: list, reference: np.ndarray) -> np.ndarray:
+    """
+    Decode an encoded update to flat float64 parameters.
+    Reference is the current global model, used if the update is delta encoded.
+    """
+    header = bytestr[0]
+    codec = CODECS[header & ~DELTA_FLAG]
+    x = codec.decode(memoryview(bytestr)[1:], sizes)
+    if header & DELTA_FLAG:
+        x += reference
+    return x
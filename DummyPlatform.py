@@ -1,6 +1,7 @@
 """
 Dummy federated learning blockchain backend for faster testing.
 """
+from costs import costs
 
 class DummyPlatform:
     modelBytes = None
@@ -8,19 +9,32 @@ class DummyPlatform:
     dataSize = 0
     means = None
     stds = None
+    maxStaleness = 0
 
     @staticmethod
     def initAccounts(amount: int):
-        return [DummyPlatform.Account() for i in range(amount)]
+        return [DummyPlatform.Account(i) for i in range(amount)]
 
     class Account:
         """
         Wraps accounts with helper functions and some additional data.
         """
+        def __init__(self, account):
+            # Index of the account, identifies it in the cost reports
+            self.account = account
+
+        def post(self, kind, size):
+            """
+            Count a transaction that posts a payload of given kind, dummy transactions use no gas.
+            """
+            costs.transaction(self.account)
+            costs.posted(self.account, kind, size)
+
         def deploy(self, modelBytes):
             """
             Deploys the contract with this account and obtain a reference to it.
             """
+            self.post("global_model", len(modelBytes))
             DummyPlatform.modelBytes = modelBytes
 
         def obtainContract(self):
@@ -30,12 +44,32 @@ class DummyPlatform:
             """
             pass
 
+        def waitReceipts(self, receipts):
+            """
+            Wait for all the given transactions to be mined.
+            """
+            return receipts
+
         def getUpdateEvents(self, receipts):
             """
             From a list of receipts get the processed events.
             """
+            return [(size, modelBytes) for epoch, size, modelBytes in receipts]
+
+        def getBufferedUpdates(self, receipts):
+            """
+            From a list of receipts get the (epoch, size, modelBytes) tuples of the updates.
+            """
             return receipts
 
+        def setMaxStaleness(self, staleness):
+            """
+            Accept updates that lag behind by at most the given number of epochs.
+            Should be called by owner only.
+            """
+            costs.transaction(self.account)
+            DummyPlatform.maxStaleness = staleness
+
         def getMeanEvents(self, receipts):
             """
             From a list of receipts get the processed mean events.
@@ -48,11 +82,18 @@ class DummyPlatform:
             """
             return receipts
 
+        def getStatsEvents(self, receipts):
+            """
+            From a list of receipts get the processed mean and variance events.
+            """
+            return receipts
+
         def globalUpdate(self, modelBytes):
             """
             Update the global model after weight averaging.
             Should be called by owner only.
             """
+            self.post("global_model", len(modelBytes))
             DummyPlatform.modelBytes = modelBytes
             DummyPlatform.epoch += 1
             DummyPlatform.dataSize = 0
@@ -62,14 +103,19 @@ class DummyPlatform:
             """
             Trigger a local update event.
             """
+            staleness = DummyPlatform.epoch - vargs[0]
+            if not 0 <= staleness <= DummyPlatform.maxStaleness:
+                raise ValueError(f"Local update epoch {vargs[0]} is not within the staleness window")
+            self.post("update", len(vargs[2]))
             DummyPlatform.dataSize += vargs[1]
-            return (vargs[1], vargs[2])
+            return vargs
 
         def globalMeans(self, means):
             """
             Update the global means.
             Should be called by owner only.
             """
+            self.post("global_means", len(means))
             DummyPlatform.means = means
             return None
 
@@ -77,6 +123,7 @@ class DummyPlatform:
             """
             Trigger a local means event.
             """
+            self.post("means", len(vargs[1]))
             return (vargs[0], vargs[1])
 
         def globalStds(self, stds):
@@ -84,6 +131,7 @@ class DummyPlatform:
             Update the global stds.
             Should be called by owner only.
             """
+            self.post("global_stds", len(stds))
             DummyPlatform.stds = stds
             return None
 
@@ -91,6 +139,25 @@ class DummyPlatform:
             """
             Trigger a local stds event.
             """
+            self.post("stds", len(vargs[1]))
+            return (vargs[0], vargs[1])
+
+        def globalStats(self, means, stds):
+            """
+            Update both global means and stds.
+            Should be called by owner only.
+            """
+            self.post("global_means", len(means))
+            costs.posted(self.account, "global_stds", len(stds))
+            DummyPlatform.means = means
+            DummyPlatform.stds = stds
+            return None
+
+        def localStats(self, *vargs):
+            """
+            Trigger a local means and variances event.
+            """
+            self.post("stats", len(vargs[1]))
             return (vargs[0], vargs[1])
 
         # The following public accessor functions don't need to use account
@@ -2,8 +2,18 @@
 This module contains Ethereum Testing platform for Federated Learning.
 """
 from web3 import Web3
-from solcx import compile_source
+from eth_tester import EthereumTester
 from dataclasses import dataclass
+import hashlib
+import threading
+
+from BlobStore import BlobStore
+from contract_cache import compile_contract
+from config import *
+
+from log import log
+from profiler import profiler
+from costs import costs
 
 
 @dataclass
@@ -15,54 +25,142 @@ class ContractInfo:
     # Application binary interface
     abi: list
     address: str
+    # Number of the block in which the contract was deployed, events are searched from here
+    block: int
 
 
-def compileContract(w3, filename, *vargs):
+def compileContract(filename):
     """
-    Given web3.py instance and .sol filename, create a contract with the default account.
-    The remaining arguments are passed to contract's constructor.
+    Compile the given .sol file with the configured optimizer, through the artifact cache.
+    Returns the (contract_id, abi, bytecode) tuple of the contract.
     """
-    with open("FL.sol", 'r') as f:
-        solidity_code = f.read()
+    return compile_contract(filename, SOLC_OPTIMIZE, SOLC_OPTIMIZE_RUNS, CONTRACT_CACHE)
 
-    compiled_sol = compile_source(solidity_code, output_values=['abi', 'bin'])
 
-    # retrieve the contract interface
-    contract_id, contract_interface = compiled_sol.popitem()
+class NonceManager:
+    """
+    Tracks the next nonce of each account locally, so that an account can send transactions
+    back to back without waiting for the previous ones to be mined.
+    Thread safe, accounts can submit concurrently.
+    """
+    def __init__(self, w3):
+        self.w3 = w3
+        self.nonces = {}
+        self.lock = threading.Lock()
 
-    bytecode = contract_interface['bin']
-    abi = contract_interface['abi']
+    def next(self, address):
+        """
+        Reserve the next nonce of the address.
+        """
+        with self.lock:
+            if address not in self.nonces:
+                self.nonces[address] = self.w3.eth.get_transaction_count(address, "pending")
+            nonce = self.nonces[address]
+            self.nonces[address] += 1
+            return nonce
+
+    def reset(self, address):
+        """
+        Forget the nonce of the address after a failed submission, it's read again from the node.
+        """
+        with self.lock:
+            self.nonces.pop(address, None)
 
-    contract = w3.eth.contract(abi=abi, bytecode=bytecode)
 
-    # Submit the transaction that deploys the contract
-    tx_hash = contract.constructor(*vargs).transact()
-    # Wait for the transaction to be mined, and get the transaction receipt
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+class ReadCache:
+    """
+    Read-through cache of the global contract state, shared by the accounts of this process.
+    Each value is stored with the key of the contract state it was read in, and read again
+    when the key changes.
+    """
+    def __init__(self):
+        self.values = {}
+
+    def get(self, name, key, read):
+        entry = self.values.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        value = read()
+        self.values[name] = (key, value)
+        return value
+
+    def clear(self):
+        self.values = {}
 
-    # Get the contract address from the receipt
-    address = tx_receipt.contractAddress
 
-    return ContractInfo(contract_id, abi, address)
+# A chunked local update posts this manifest in its LocalUpdate event instead of the model:
+# magic, number of chunks as 4 bytes, and SHA-256 of the whole payload.
+CHUNK_MANIFEST_MAGIC = b'CHUNKED\0'
+CHUNK_MANIFEST_SIZE = len(CHUNK_MANIFEST_MAGIC) + 4 + 32
 
 
-def useAccount(func):
+def makeManifest(count, data):
+    return CHUNK_MANIFEST_MAGIC + count.to_bytes(4, "big") + hashlib.sha256(data).digest()
+
+
+def parseManifest(data):
     """
-    A decorator for functions that need to use the account set in self.account
+    Returns the (count, digest) tuple in the given manifest, or None if data is not a manifest.
     """
-    def f(self, *vargs, **kwargs):
-        EthPlatform.w3.eth.default_account = self.account
-        return func(self, *vargs, **kwargs)
-    return f
+    if len(data) != CHUNK_MANIFEST_SIZE or not data.startswith(CHUNK_MANIFEST_MAGIC):
+        return None
+    offset = len(CHUNK_MANIFEST_MAGIC)
+    return int.from_bytes(data[offset:offset+4], "big"), data[offset+4:]
+
+
+def splitChunks(data, chunkSize):
+    return [data[i:i+chunkSize] for i in range(0, len(data), chunkSize)]
+
+
+def chunkGasLimit(size):
+    """
+    Upper bound of the gas needed to store a chunk of the given size.
+    Pipelined chunks can't be estimated, since they depend on the previous ones that
+    aren't mined yet. Assumes every 32-byte word is written to a fresh storage slot.
+    """
+    words = (size + 31) // 32 + 1
+    return 21000 + 16 * size + 22100 * words + 50000
+
+
+# Gas limit of finalizeGlobalUpdate, which only updates a few slots
+FINALIZE_GAS_LIMIT = 200000
+
+# Number of blocks covered by each log query of getUpdateEvents
+LOG_PAGE_BLOCKS = 100
+
 
 class EthPlatform:
     contractFilename = "FL.sol"
+    optimizedContractFilename = "FLOptimized.sol"
     contractInfo = None
     w3 = None
+    nonces = None
+    readCache = None
+    # Set if auto-mining is off, transactions stay pending until mine is called
+    tester = None
+    pendingSenders = set()
+    pendingGas = 0
+    miningLock = threading.Lock()
+    # Model, means and stds are read from events instead of contract storage.
+    # Only supported by the optimized contract.
+    eventSourced = False
+    # If set, models and updates are kept off-chain and only their commitments are on chain
+    blobStore = None
 
     @staticmethod
     def initAccounts(amount: int):
-        EthPlatform.w3 = Web3(Web3.EthereumTesterProvider())
+        if AUTO_MINE:
+            EthPlatform.w3 = Web3(Web3.EthereumTesterProvider())
+        else:
+            EthPlatform.tester = EthereumTester(auto_mine_transactions=False)
+            EthPlatform.w3 = Web3(Web3.EthereumTesterProvider(EthPlatform.tester))
+        EthPlatform.nonces = NonceManager(EthPlatform.w3)
+        EthPlatform.readCache = ReadCache() if READ_CACHE else None
+        if BLOB_STORE:
+            EthPlatform.blobStore = BlobStore(BLOB_STORE)
+        if OPTIMIZED_CONTRACT:
+            EthPlatform.contractFilename = EthPlatform.optimizedContractFilename
+        EthPlatform.eventSourced = EVENT_SOURCED
 
         amount = min(amount, len(EthPlatform.w3.eth.accounts))
         users = []
@@ -70,21 +168,226 @@ class EthPlatform:
             users.append(EthPlatform.Account(account))
         return users
 
+    @staticmethod
+    def mine():
+        """
+        Mine all the pending transactions into a block, if auto-mining is off.
+        """
+        with EthPlatform.miningLock:
+            EthPlatform.minePending()
+
+    @staticmethod
+    def minePending():
+        if EthPlatform.tester is not None and EthPlatform.pendingSenders:
+            EthPlatform.tester.mine_blocks(1)
+            EthPlatform.pendingSenders = set()
+            EthPlatform.pendingGas = 0
+
+    @staticmethod
+    def reserveBlockSpace(sender, gas):
+        """
+        Make room for a transaction in the pending block, mining it first if needed.
+        The tester keeps only one pending transaction per sender, and the pending
+        transactions must fit within the block gas limit.
+        """
+        with EthPlatform.miningLock:
+            gasLimit = EthPlatform.w3.eth.get_block("latest").gasLimit
+            if (sender in EthPlatform.pendingSenders
+                    or EthPlatform.pendingGas + gas > gasLimit
+                    or 0 < MINING_BATCH_SIZE <= len(EthPlatform.pendingSenders)):
+                EthPlatform.minePending()
+            EthPlatform.pendingSenders.add(sender)
+            EthPlatform.pendingGas += gas
+
     class Account:
         """
         Wraps accounts with helper functions and some additional data.
         """
         def __init__(self, account):
             self.account = account
+            # Block of the last global update sent by this account.
+            # Updates of the current epoch can't be in earlier blocks.
+            self.epochBlock = None
+            # (block, log index) of the last update read in asynchronous training
+            self.updateCursor = None
 
-        @useAccount
-        def deploy(self, *vargs):
+        def send(self, function, gas=None):
+            """
+            Submit the transaction of a contract function or constructor from this account
+            without waiting for it to be mined. Returns the transaction hash.
+            """
+            transaction = {"from": self.account}
+            if gas is not None:
+                transaction["gas"] = gas
+            if EthPlatform.tester is not None:
+                if gas is None:
+                    transaction["gas"] = function.estimateGas(transaction)
+                EthPlatform.reserveBlockSpace(self.account, transaction["gas"])
+            transaction["nonce"] = EthPlatform.nonces.next(self.account)
+            try:
+                with profiler.timer("transact"):
+                    tx_hash = function.transact(transaction)
+            except Exception:
+                EthPlatform.nonces.reset(self.account)
+                raise
+            # Only transactions that were accepted by the node are counted
+            costs.transaction(self.account)
+            return tx_hash
+
+        def wait(self, tx_hash):
+            """
+            Wait for the transaction to be mined and return its receipt.
+            Without auto-mining, pending transactions are mined first.
+            """
+            with profiler.timer("wait_receipt"):
+                EthPlatform.mine()
+                tx_receipt = EthPlatform.w3.eth.wait_for_transaction_receipt(tx_hash)
+            costs.gas(tx_receipt["from"], tx_receipt["gasUsed"])
+            return tx_receipt
+
+        def submit(self, function, gas=None):
+            """
+            Submit the transaction of a local report.
+            Returns the transaction hash if transactions are asynchronous, otherwise waits for
+            the receipt. Pending transactions are resolved by waitReceipts.
+            """
+            tx_hash = self.send(function, gas)
+            if ASYNC_TRANSACTIONS:
+                return tx_hash
+            return self.wait(tx_hash)
+
+        def waitReceipts(self, receipts):
+            """
+            Wait for all the given transactions to be mined.
+            Items are receipts, transaction hashes or lists of them for chunked updates.
+            Without auto-mining, all of them are mined together.
+            Returns the list of receipts.
+            """
+            EthPlatform.mine()
+            w3 = EthPlatform.w3
+            def wait(tx):
+                if isinstance(tx, list):
+                    return [wait(item) for item in tx]
+                if isinstance(tx, (bytes, str)):
+                    tx_receipt = w3.eth.wait_for_transaction_receipt(tx)
+                    costs.gas(tx_receipt["from"], tx_receipt["gasUsed"])
+                    return tx_receipt
+                # Receipts were already counted when they were waited
+                return tx
+            return [wait(tx) for tx in receipts]
+
+        def putBlob(self, data):
+            """
+            Returns the bytes to post on chain for the given model blob.
+            """
+            if EthPlatform.blobStore is None:
+                return data
+            return EthPlatform.blobStore.put(data)
+
+        def getBlob(self, data):
+            """
+            Returns the model blob from the bytes posted on chain.
+            """
+            if EthPlatform.blobStore is None:
+                return data
+            return EthPlatform.blobStore.get(data)
+
+        def isChunked(self, data):
+            """
+            Whether the given data should be uploaded in multiple transactions.
+            """
+            return UPLOAD_CHUNK_SIZE > 0 and len(data) > UPLOAD_CHUNK_SIZE
+
+        def deploy(self, modelBytes):
             """
             Deploys the contract with this account and obtain a reference to it.
             """
-            EthPlatform.contractInfo = compileContract(
-                    EthPlatform.w3, EthPlatform.contractFilename, *vargs)
+            data = self.putBlob(modelBytes)
+            costs.posted(self.account, "global_model", len(data))
+            chunked = self.isChunked(data)
+            # Initial model doesn't fit in the constructor transaction if chunked
+            args = [b'' if chunked else data]
+            if EthPlatform.contractFilename == EthPlatform.optimizedContractFilename:
+                args.append(EthPlatform.eventSourced)
+            contract_id, abi, bytecode = compileContract(EthPlatform.contractFilename)
+            constructor = EthPlatform.w3.eth.contract(abi=abi, bytecode=bytecode).constructor(*args)
+            tx_receipt = self.wait(self.send(constructor))
+            EthPlatform.contractInfo = ContractInfo(
+                    contract_id, abi, tx_receipt.contractAddress, tx_receipt.blockNumber)
+            self.invalidateCache()
             self.obtainContract()
+            if chunked:
+                self.uploadModelChunks(data)
+
+        def uploadModelChunks(self, data):
+            """
+            Upload the global model in chunks and finalize it.
+            Chunk transactions are sent back to back, receipts are waited only at the end.
+            Returns the transaction receipt of the finalization.
+            """
+            self.wait(self.send(self.contract.functions.beginGlobalUpdate()))
+            chunks = splitChunks(data, UPLOAD_CHUNK_SIZE)
+            tx_hashes = [
+                    self.send(self.contract.functions.appendGlobalUpdate(chunk), chunkGasLimit(len(chunk)))
+                    for chunk in chunks]
+            tx_hashes.append(self.send(
+                self.contract.functions.finalizeGlobalUpdate(len(chunks)), FINALIZE_GAS_LIMIT))
+            receipts = [self.wait(tx_hash) for tx_hash in tx_hashes]
+            self.epochBlock = receipts[-1].blockNumber
+            self.invalidateCache()
+            return receipts[-1]
+
+        def joinUpdateChunks(self, chunks, manifest):
+            """
+            Reassemble a chunked local update from its chunks, a dict from index to data.
+            Returns None if the chunks don't match the manifest.
+            """
+            count, digest = manifest
+            if sorted(chunks) != list(range(count)):
+                return None
+            data = b''.join(chunks[i] for i in range(count))
+            if hashlib.sha256(data).digest() != digest:
+                return None
+            return data
+
+        def getEvents(self, event, fromBlock=None, **argument_filters):
+            """
+            Fetch and decode all events of given type with a single filtered log query.
+            Search starts from the deployment of the contract by default.
+            """
+            if fromBlock is None:
+                fromBlock = EthPlatform.contractInfo.block
+            with profiler.timer("get_logs"):
+                return event.getLogs(fromBlock=fromBlock, argument_filters=argument_filters)
+
+        def getEventPages(self, event, fromBlock=None, toBlock=None, **argument_filters):
+            """
+            Fetch and decode the events of given type with one filtered log query per
+            LOG_PAGE_BLOCKS blocks, so that only a single page of logs is in memory at a time.
+            Search ends at the latest block when the search starts by default.
+            """
+            if fromBlock is None:
+                fromBlock = EthPlatform.contractInfo.block
+            if toBlock is None:
+                toBlock = EthPlatform.w3.eth.block_number
+            while fromBlock <= toBlock:
+                pageEnd = min(fromBlock + LOG_PAGE_BLOCKS - 1, toBlock)
+                with profiler.timer("get_logs"):
+                    logs = event.getLogs(fromBlock=fromBlock, toBlock=pageEnd, argument_filters=argument_filters)
+                yield from logs
+                fromBlock = pageEnd + 1
+
+        def getUpdateChunks(self, epoch, address, fromBlock, toBlock):
+            """
+            Returns the local update chunks of given epoch sent by the given address,
+            as a dict from chunk index to data.
+            """
+            chunks = {}
+            for event in self.getEventPages(self.contract.events.LocalUpdateChunk, fromBlock, toBlock,
+                    epoch=epoch, **{"from": address}):
+                args = event["args"]
+                chunks[args["index"]] = args["data"]
+            return chunks
 
         def obtainContract(self):
             """
@@ -95,143 +398,262 @@ class EthPlatform:
                     address=EthPlatform.contractInfo.address,
                     abi=EthPlatform.contractInfo.abi)
 
-        @useAccount
-        def getUpdateEvents(self, receipts):
+        def getUpdateEvents(self, receipts=None):
             """
-            From a list of receipts get the processed update events.
+            Get the processed update events of the current epoch from the blockchain logs.
+            Updates are found by their indexed epoch, so updates of earlier epochs are
+            filtered out and receipts are not needed.
+            Events are generated lazily and logs are queried in pages of blocks, so that the
+            caller can process them one at a time. Memory use grows with the page size, and
+            only the addresses seen so far are kept for the whole epoch.
             """
-            events = []
             seenAddresses = set()
             epoch = self.getEpoch()
-            for tx_receipt in receipts:
-                logs = self.contract.events.LocalUpdate().processReceipt(tx_receipt)
-                assert(len(logs) == 1)
-                args = logs[0]["args"]
+            fromBlock = self.epochBlock
+            for event in self.getEventPages(self.contract.events.LocalUpdate, fromBlock, epoch=epoch):
+                args = event["args"]
                 address = args["from"]
                 if address in seenAddresses:
                     log.warning(f"Ignoring repeated update from address {address}")
                     continue
                 seenAddresses.add(address)
-                updateEpoch = epoch
-                if epoch != updateEpoch:
-                    log.warning(f"Ignoring update with incorrect epoch {updateEpoch} from {address}")
-                    continue
                 size = args["size"]
                 modelBytes = args["model"]
-                events.append((size, modelBytes))
-            return events
-
-        @useAccount
-        def getMeanEvents(self, receipts):
+                manifest = parseManifest(modelBytes)
+                if manifest is not None:
+                    # Chunks are sent before their manifest
+                    chunks = self.getUpdateChunks(epoch, address, fromBlock, event.blockNumber)
+                    modelBytes = self.joinUpdateChunks(chunks, manifest)
+                    if modelBytes is None:
+                        log.warning(f"Ignoring chunked update with missing or invalid chunks from {address}")
+                        continue
+                modelBytes = self.getBlob(modelBytes)
+                yield size, modelBytes
+
+        def getBufferedUpdates(self, receipts=None):
             """
-            From a list of receipts get the processed mean events.
+            Get the update events sent since the last call, of any epoch, for asynchronous
+            training. Returns a list of (epoch, size, modelBytes) tuples, receipts are not needed.
             """
-            events = []
-            seenAddresses = set()
-            for tx_receipt in receipts:
-                logs = self.contract.events.LocalMeans().processReceipt(tx_receipt)
-                assert(len(logs) == 1)
-                args = logs[0]["args"]
-                address = args["from"]
-                if address in seenAddresses:
-                    log.warning(f"Ignoring repeated mean report from address {address}")
+            fromBlock = None if self.updateCursor is None else self.updateCursor[0]
+            updates = []
+            for event in self.getEvents(self.contract.events.LocalUpdate, fromBlock):
+                position = (event.blockNumber, event.logIndex)
+                if self.updateCursor is not None and position <= self.updateCursor:
                     continue
-                seenAddresses.add(address)
-                size = args["size"]
-                means = args["data"]
-                events.append((size, means))
-            return events
+                self.updateCursor = position
+                args = event["args"]
+                updates.append((args["epoch"], args["size"], self.getBlob(args["model"])))
+            return updates
 
-        @useAccount
-        def getStdEvents(self, receipts):
+        def getReportEvents(self, event):
             """
-            From a list of receipts get the processed std events.
+            Get the processed preprocessing report events of given type from the blockchain logs.
+            Returns a list of (size, data) tuples.
             """
             events = []
             seenAddresses = set()
-            for tx_receipt in receipts:
-                logs = self.contract.events.LocalStds().processReceipt(tx_receipt)
-                assert(len(logs) == 1)
-                args = logs[0]["args"]
+            for logEntry in self.getEvents(event):
+                args = logEntry["args"]
                 address = args["from"]
                 if address in seenAddresses:
-                    log.warning(f"Ignoring repeated mean report from address {address}")
+                    log.warning(f"Ignoring repeated {event.event_name} report from address {address}")
                     continue
                 seenAddresses.add(address)
                 size = args["size"]
-                means = args["data"]
-                events.append((size, means))
+                data = args["data"]
+                events.append((size, data))
             return events
 
-        @useAccount
+        def getMeanEvents(self, receipts=None):
+            """
+            Get the processed mean events, receipts are not needed.
+            """
+            return self.getReportEvents(self.contract.events.LocalMeans)
+
+        def getStdEvents(self, receipts=None):
+            """
+            Get the processed std events, receipts are not needed.
+            """
+            return self.getReportEvents(self.contract.events.LocalStds)
+
+        def getStatsEvents(self, receipts=None):
+            """
+            Get the processed mean and variance events, receipts are not needed.
+            """
+            return self.getReportEvents(self.contract.events.LocalStats)
+
         def globalUpdate(self, modelBytes):
             """
             Update the global model after weight averaging.
             Should be called by owner only.
             """
-            tx_hash = self.contract.functions.globalUpdate(modelBytes).transact()
-            tx_receipt = EthPlatform.w3.eth.wait_for_transaction_receipt(tx_hash)
+            data = self.putBlob(modelBytes)
+            costs.posted(self.account, "global_model", len(data))
+            if self.isChunked(data):
+                return self.uploadModelChunks(data)
+            tx_hash = self.send(self.contract.functions.globalUpdate(data))
+            tx_receipt = self.wait(tx_hash)
+            self.epochBlock = tx_receipt.blockNumber
+            self.invalidateCache()
             return tx_receipt
 
-        @useAccount
-        def localUpdate(self, *vargs):
+        def localUpdate(self, epoch, size, modelBytes):
             """
             Trigger a local update event.
+            Large updates are sent in chunks, in which case a list is returned.
+            """
+            data = self.putBlob(modelBytes)
+            costs.posted(self.account, "update", len(data))
+            if self.isChunked(data):
+                chunks = splitChunks(data, UPLOAD_CHUNK_SIZE)
+                pending = [
+                        self.submit(self.contract.functions.localUpdateChunk(epoch, i, chunk))
+                        for i, chunk in enumerate(chunks)]
+                pending.append(self.submit(self.contract.functions.localUpdate(
+                    epoch, size, makeManifest(len(chunks), data))))
+                return pending
+            return self.submit(self.contract.functions.localUpdate(epoch, size, data))
+
+        def setMaxStaleness(self, staleness):
             """
-            tx_hash = self.contract.functions.localUpdate(*vargs).transact()
-            tx_receipt = EthPlatform.w3.eth.wait_for_transaction_receipt(tx_hash)
+            Accept local updates that lag behind by at most the given number of epochs.
+            Should be called by owner only.
+            """
+            tx_hash = self.send(self.contract.functions.setMaxStaleness(staleness))
+            tx_receipt = self.wait(tx_hash)
+            self.invalidateCache()
             return tx_receipt
 
-        @useAccount
         def globalMeans(self, meanBytes):
             """
             Update the global means after mean averaging.
             Should be called by owner only.
             """
-            tx_hash = self.contract.functions.globalMeans(meanBytes).transact()
-            tx_receipt = EthPlatform.w3.eth.wait_for_transaction_receipt(tx_hash)
+            costs.posted(self.account, "global_means", len(meanBytes))
+            tx_hash = self.send(self.contract.functions.globalMeans(meanBytes))
+            tx_receipt = self.wait(tx_hash)
+            self.invalidateCache()
             return tx_receipt
 
-        @useAccount
-        def localMeans(self, *vargs):
+        def localMeans(self, size, meanBytes):
             """
             Trigger a local means event.
             """
-            tx_hash = self.contract.functions.localMeans(*vargs).transact()
-            tx_receipt = EthPlatform.w3.eth.wait_for_transaction_receipt(tx_hash)
-            return tx_receipt
+            costs.posted(self.account, "means", len(meanBytes))
+            return self.submit(self.contract.functions.localMeans(size, meanBytes))
 
-        @useAccount
         def globalStds(self, stdBytes):
             """
             Update the global stds after std averaging.
             Should be called by owner only.
             """
-            tx_hash = self.contract.functions.globalStds(stdBytes).transact()
-            tx_receipt = EthPlatform.w3.eth.wait_for_transaction_receipt(tx_hash)
+            costs.posted(self.account, "global_stds", len(stdBytes))
+            tx_hash = self.send(self.contract.functions.globalStds(stdBytes))
+            tx_receipt = self.wait(tx_hash)
+            self.invalidateCache()
             return tx_receipt
 
-        @useAccount
-        def localStds(self, *vargs):
+        def localStds(self, size, stdBytes):
             """
             Trigger a local stds event.
             """
-            tx_hash = self.contract.functions.localStds(*vargs).transact()
-            tx_receipt = EthPlatform.w3.eth.wait_for_transaction_receipt(tx_hash)
+            costs.posted(self.account, "stds", len(stdBytes))
+            return self.submit(self.contract.functions.localStds(size, stdBytes))
+
+        def globalStats(self, meanBytes, stdBytes):
+            """
+            Update both global means and stds in single-round preprocessing.
+            Should be called by owner only.
+            """
+            costs.posted(self.account, "global_means", len(meanBytes))
+            costs.posted(self.account, "global_stds", len(stdBytes))
+            tx_hash = self.send(self.contract.functions.globalStats(meanBytes, stdBytes))
+            tx_receipt = self.wait(tx_hash)
+            self.invalidateCache()
             return tx_receipt
 
+        def localStats(self, size, statBytes):
+            """
+            Trigger a local means and variances event.
+            """
+            costs.posted(self.account, "stats", len(statBytes))
+            return self.submit(self.contract.functions.localStats(size, statBytes))
+
         # The following public accessor functions don't need to use account
+        def getLastEvent(self, event, **argument_filters):
+            """
+            Returns the arguments of the last event of given type matching the filters.
+            Used to read the global values in event-sourced mode.
+            """
+            logs = self.getEvents(event, **argument_filters)
+            assert(len(logs) > 0)
+            return logs[-1]["args"]
+
+        def invalidateCache(self):
+            """
+            Drop the cached contract state after a global write of this process, since
+            a chunked model upload may change the model without changing epoch or stage.
+            """
+            if EthPlatform.readCache is not None:
+                EthPlatform.readCache.clear()
+
+        def cached(self, name, key, read):
+            """
+            Read a value through the read cache, if enabled.
+            Key is a function computing the contract state that determines the value.
+            """
+            if EthPlatform.readCache is None:
+                return read()
+            return EthPlatform.readCache.get(name, key(), read)
+
+        def getState(self):
+            """
+            Returns the current (epoch, stage) of the contract, read once per block.
+            """
+            functions = self.contract.functions
+            return self.cached("state", lambda: EthPlatform.w3.eth.block_number,
+                    lambda: (functions.getEpoch().call(), functions.stage().call()))
+
+        def readModel(self):
+            functions = self.contract.functions
+            if EthPlatform.eventSourced:
+                epoch = functions.getEpoch().call()
+                data = self.getLastEvent(self.contract.events.GlobalModel, epoch=epoch)["model"]
+                return self.getBlob(data)
+            count = functions.getModelChunkCount().call()
+            if count > 0:
+                data = b''.join(functions.getModelChunk(i).call() for i in range(count))
+            else:
+                data = functions.getModel().call()
+            return self.getBlob(data)
+
         def getModel(self):
-            return self.contract.functions.getModel().call()
+            # The model only changes with the epoch, or with the stage at deployment
+            return self.cached("model", self.getState, self.readModel)
 
         def getEpoch(self):
-            return self.contract.functions.getEpoch().call()
+            if EthPlatform.readCache is None:
+                return self.contract.functions.getEpoch().call()
+            return self.getState()[0]
 
         def getDataSize(self):
-            return self.contract.functions.getDataSize().call()
+            return self.cached("dataSize", lambda: EthPlatform.w3.eth.block_number,
+                    self.contract.functions.getDataSize().call)
 
-        def getMeans(self):
+        def readMeans(self):
+            if EthPlatform.eventSourced:
+                return self.getLastEvent(self.contract.events.GlobalMeans)["data"]
             return self.contract.functions.getMeans().call()
 
-        def getStds(self):
+        def readStds(self):
+            if EthPlatform.eventSourced:
+                return self.getLastEvent(self.contract.events.GlobalStds)["data"]
             return self.contract.functions.getStds().call()
+
+        # Means and stds are only set at the end of a preprocessing stage
+        def getMeans(self):
+            return self.cached("means", lambda: self.getState()[1], self.readMeans)
+
+        def getStds(self):
+            return self.cached("stds", lambda: self.getState()[1], self.readStds)
@@ -0,0 +1,69 @@
+"""
+Evaluation of the global model on the validation set.
+"""
+import copy
+import torch
+import torch.nn.functional as F
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Evaluator:
+    """
+    Scores models on the standardized test set in large inference-mode chunks.
+    In background mode, each evaluation runs in a worker thread on a snapshot of the model,
+    so that the next epoch can start while the previous model is being scored.
+    """
+    def __init__(self, X: torch.Tensor, y: torch.Tensor, chunkSize: int, background=False):
+        self.X = X.contiguous()
+        self.y = y.contiguous()
+        self.chunkSize = chunkSize
+        self.executor = ThreadPoolExecutor(1) if background else None
+        # (epoch, result or future of the result) in submission order
+        self.jobs = []
+
+    def evaluate(self, model):
+        """
+        Test the accuracy and loss of the model.
+        Returns the (accuracy, loss) tuple.
+        """
+        model.eval()
+        loss = torch.zeros((), dtype=torch.float64)
+        correct = torch.zeros((), dtype=torch.long)
+        with torch.inference_mode():
+            for start in range(0, len(self.y), self.chunkSize):
+                X = self.X[start:start+self.chunkSize]
+                y = self.y[start:start+self.chunkSize]
+                prediction = model(X)
+                loss += F.cross_entropy(prediction, y, reduction='sum').double()
+                correct += (prediction.argmax(1) == y).sum()
+        n = len(self.y)
+        return correct.item() / n, loss.item() / n
+
+    def submit(self, epoch, model):
+        """
+        Evaluate the model of the given global epoch, in the background if enabled.
+        Returns the (accuracy, loss) tuple, or None if evaluated in the background.
+        """
+        if self.executor is None:
+            result = self.evaluate(model)
+            self.jobs.append((epoch, result))
+            return result
+        else:
+            # The model is updated in place by the next epoch
+            snapshot = copy.deepcopy(model)
+            self.jobs.append((epoch, self.executor.submit(self.evaluate, snapshot)))
+
+    def results(self):
+        """
+        Wait for all the submitted evaluations.
+        Returns a list of (epoch, accuracy, loss) tuples in submission order.
+        """
+        results = []
+        for epoch, job in self.jobs:
+            accuracy, loss = job.result() if self.executor is not None else job
+            results.append((epoch, accuracy, loss))
+        return results
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -7,6 +7,7 @@ contract FederatedLearningContract {
 	address public owner;
 
 	// Enum representing current stage of the federated learning model
+	// With single-round preprocessing, PREPROCESS_STDS stage is skipped.
 	enum Stage{ PREPROCESS_MEANS, PREPROCESS_STDS, TRAINING }
 	Stage public stage;
 
@@ -14,6 +15,9 @@ contract FederatedLearningContract {
 	uint public epoch;
 	// Total size of the submitted data within the current epoch.
 	uint public dataSize;
+	// Maximum number of epochs that a local update may lag behind the global epoch.
+	// 0 only accepts updates of the current epoch, i.e., synchronous federated learning.
+	uint public maxStaleness;
 
 	// Representation of the model in bytes.
 	bytes public model;
@@ -21,11 +25,26 @@ contract FederatedLearningContract {
 	bytes public means;
 	bytes public stds;
 
+	// Chunked storage of the model, for models that don't fit in a single transaction.
+	// Double buffered: chunks are uploaded to the inactive buffer, finalizing only flips the index.
+	bytes[][2] modelChunks;
+	uint[2] modelChunkCounts;
+	uint8 activeChunks;
+	// Index of the next chunk to write in the inactive buffer.
+	uint uploadCursor;
+	// Whether the current model is in modelChunks instead of model.
+	bool chunkedModel;
+
 	// This event is fired when a client reports a local update at given epoch.
-	event LocalUpdate(address indexed from, uint epoch, uint size, bytes model);
+	event LocalUpdate(address indexed from, uint indexed epoch, uint size, bytes model);
 	// These events are fired during the preprocessing stage by the clients.
 	event LocalMeans(address indexed from, uint size, bytes data);
 	event LocalStds(address indexed from, uint size, bytes data);
+	// Fired for each chunk of a local update that is uploaded in multiple transactions.
+	// The final LocalUpdate event of such an update contains a manifest instead of the model.
+	event LocalUpdateChunk(address indexed from, uint indexed epoch, uint index, bytes data);
+	// Fired by the clients in single-round preprocessing, data contains both local means and variances.
+	event LocalStats(address indexed from, uint size, bytes data);
 
 	constructor(bytes memory initialModel) public {
 		// Owner is the one who ran the constructor method
@@ -46,11 +65,30 @@ contract FederatedLearningContract {
 	// it runs this function to commit this update to blockchain.
 	function localUpdate(uint localEpoch, uint size, bytes memory localModel) public {
 		require(stage == Stage.TRAINING, "Can only be called in training stage!");
-		require(localEpoch == epoch, "Local update epoch is not the same as global epoch!");
+		require(isFresh(localEpoch), "Local update epoch is not within the staleness window!");
 		dataSize += size;
 		emit LocalUpdate(msg.sender, localEpoch, size, localModel);
 	}
 
+	// Upload a chunk of a local update that doesn't fit in a single transaction.
+	// After all chunks, localUpdate is called with the manifest.
+	function localUpdateChunk(uint localEpoch, uint index, bytes memory chunk) public {
+		require(stage == Stage.TRAINING, "Can only be called in training stage!");
+		require(isFresh(localEpoch), "Local update epoch is not within the staleness window!");
+		emit LocalUpdateChunk(msg.sender, localEpoch, index, chunk);
+	}
+
+	// Whether an update trained from the model of the given epoch is still accepted.
+	function isFresh(uint localEpoch) private view returns(bool) {
+		return localEpoch <= epoch && epoch - localEpoch <= maxStaleness;
+	}
+
+	// Accept updates that lag behind by at most the given number of epochs,
+	// for asynchronous federated learning.
+	function setMaxStaleness(uint staleness) public OwnerOnly {
+		maxStaleness = staleness;
+	}
+
 	// Individual client reports of means.
 	// Similar to localUpdate in terms of operation.
 	function localMeans(uint size, bytes memory data) public {
@@ -65,6 +103,13 @@ contract FederatedLearningContract {
 		emit LocalStds(msg.sender, size, data);
 	}
 
+	// Individual client reports of means and variances in single-round preprocessing.
+	// Similar to localUpdate in terms of operation.
+	function localStats(uint size, bytes memory data) public {
+		require(stage == Stage.PREPROCESS_MEANS, "Can only be called in means preprocessing stage!");
+		emit LocalStats(msg.sender, size, data);
+	}
+
 	// After the weight updates are averaged, this function is called
 	// to update the model on blockchain.
 	// Can be called by owner-only, since the actual model updates are limited to the owner.
@@ -73,12 +118,47 @@ contract FederatedLearningContract {
 	function globalUpdate(bytes memory updatedModel) public OwnerOnly {
 		require(stage == Stage.TRAINING, "Can only be called in training stage!");
 		model = updatedModel;
+		chunkedModel = false;
 		// Advance epoch
 		epoch += 1;
 		// Reset the submitted data size
 		dataSize = 0;
 	}
 
+	// Chunked alternative to globalUpdate: the owner calls beginGlobalUpdate,
+	// uploads the chunks in order with appendGlobalUpdate, then calls finalizeGlobalUpdate.
+	// Chunks can be sent back to back without waiting for each other.
+	function beginGlobalUpdate() public OwnerOnly {
+		uploadCursor = 0;
+	}
+
+	function appendGlobalUpdate(bytes memory chunk) public OwnerOnly {
+		uint8 buffer = 1 - activeChunks;
+		// Overwrite the chunks of an older model instead of clearing them first
+		if (uploadCursor < modelChunks[buffer].length) {
+			modelChunks[buffer][uploadCursor] = chunk;
+		} else {
+			modelChunks[buffer].push(chunk);
+		}
+		uploadCursor += 1;
+	}
+
+	// Activate the uploaded chunks as the new model.
+	// Before the training stage, this only sets the initial model.
+	function finalizeGlobalUpdate(uint count) public OwnerOnly {
+		uint8 buffer = 1 - activeChunks;
+		require(count == uploadCursor, "Not all chunks are uploaded!");
+		modelChunkCounts[buffer] = count;
+		activeChunks = buffer;
+		chunkedModel = true;
+		if (stage == Stage.TRAINING) {
+			// Advance epoch
+			epoch += 1;
+			// Reset the submitted data size
+			dataSize = 0;
+		}
+	}
+
 	// Used by the owner to submit global means and advance the stage to std preprocessing.
 	function globalMeans(bytes memory data) public OwnerOnly {
 		require(stage == Stage.PREPROCESS_MEANS, "Can only be called in means preprocessing stage!");
@@ -95,12 +175,32 @@ contract FederatedLearningContract {
 		stage = Stage.TRAINING;
 	}
 
+	// Used by the owner to submit both global means and stds in single-round preprocessing.
+	// Advances the stage directly to training.
+	function globalStats(bytes memory meanData, bytes memory stdData) public OwnerOnly {
+		require(stage == Stage.PREPROCESS_MEANS, "Can only be called in means preprocessing stage!");
+		means = meanData;
+		stds = stdData;
+		// Advance stage
+		stage = Stage.TRAINING;
+	}
+
 	// Public getter methods follow.
 
 	function getModel() view public returns(bytes memory) {
 		return model;
 	}
 
+	// Number of chunks of the current model, 0 if it's not chunked.
+	function getModelChunkCount() view public returns(uint) {
+		return chunkedModel ? modelChunkCounts[activeChunks] : 0;
+	}
+
+	function getModelChunk(uint index) view public returns(bytes memory) {
+		require(index < getModelChunkCount(), "Chunk index out of range!");
+		return modelChunks[activeChunks][index];
+	}
+
 	function getMeans() view public returns(bytes memory) {
 		return means;
 	}
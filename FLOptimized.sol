@@ -0,0 +1,175 @@
+pragma solidity >=0.8.15;
+
+// Gas optimized variant of FederatedLearningContract in FL.sol, with the same interface.
+// Differences:
+// - owner, stage, epoch and dataSize are packed in a single storage slot.
+// - External functions take calldata parameters instead of copying them to memory.
+// - Custom errors instead of revert strings.
+// - Optional event-sourced mode, in which model, means and stds are only emitted in events
+//   and never written to storage. Clients read them from the events instead.
+// - Chunked global model upload is not supported, local update chunks are.
+contract FederatedLearningContractOptimized {
+	enum Stage{ PREPROCESS_MEANS, PREPROCESS_STDS, TRAINING }
+
+	// The following fields are packed in one slot: 160 + 8 + 32 + 56 bits.
+	// Owner will act as the "server" for federated learning
+	address public owner;
+	Stage public stage;
+	// Current global epoch.
+	uint32 public epoch;
+	// Total size of the submitted data within the current epoch.
+	uint56 public dataSize;
+
+	// Maximum number of epochs that a local update may lag behind the global epoch.
+	uint32 public maxStaleness;
+
+	// Immutable, so it's stored in the code instead of storage.
+	bool public immutable eventSourced;
+
+	// Only used if not event sourced.
+	bytes model;
+	bytes means;
+	bytes stds;
+
+	event LocalUpdate(address indexed from, uint indexed epoch, uint size, bytes model);
+	event LocalUpdateChunk(address indexed from, uint indexed epoch, uint index, bytes data);
+	event LocalMeans(address indexed from, uint size, bytes data);
+	event LocalStds(address indexed from, uint size, bytes data);
+	event LocalStats(address indexed from, uint size, bytes data);
+	// Only emitted in event-sourced mode.
+	// GlobalModel is emitted with the epoch in which the model becomes current.
+	event GlobalModel(uint indexed epoch, bytes model);
+	event GlobalMeans(bytes data);
+	event GlobalStds(bytes data);
+
+	error OwnerOnlyFunction();
+	error WrongStage();
+	error WrongEpoch();
+	error SizeOverflow();
+
+	constructor(bytes memory initialModel, bool isEventSourced) {
+		owner = msg.sender;
+		eventSourced = isEventSourced;
+		if (isEventSourced) {
+			emit GlobalModel(0, initialModel);
+		} else {
+			model = initialModel;
+		}
+	}
+
+	modifier OwnerOnly() {
+		if (msg.sender != owner) revert OwnerOnlyFunction();
+		_;
+	}
+
+	modifier InStage(Stage required) {
+		if (stage != required) revert WrongStage();
+		_;
+	}
+
+	function localUpdate(uint localEpoch, uint size, bytes calldata localModel) external InStage(Stage.TRAINING) {
+		if (!isFresh(localEpoch)) revert WrongEpoch();
+		if (size > type(uint56).max) revert SizeOverflow();
+		// Checked arithmetic reverts on overflow
+		dataSize += uint56(size);
+		emit LocalUpdate(msg.sender, localEpoch, size, localModel);
+	}
+
+	function localUpdateChunk(uint localEpoch, uint index, bytes calldata chunk) external InStage(Stage.TRAINING) {
+		if (!isFresh(localEpoch)) revert WrongEpoch();
+		emit LocalUpdateChunk(msg.sender, localEpoch, index, chunk);
+	}
+
+	function isFresh(uint localEpoch) private view returns(bool) {
+		// Reads epoch and maxStaleness once each
+		uint current = epoch;
+		return localEpoch <= current && current - localEpoch <= maxStaleness;
+	}
+
+	function setMaxStaleness(uint32 staleness) external OwnerOnly {
+		maxStaleness = staleness;
+	}
+
+	function localMeans(uint size, bytes calldata data) external InStage(Stage.PREPROCESS_MEANS) {
+		emit LocalMeans(msg.sender, size, data);
+	}
+
+	function localStds(uint size, bytes calldata data) external InStage(Stage.PREPROCESS_STDS) {
+		emit LocalStds(msg.sender, size, data);
+	}
+
+	function localStats(uint size, bytes calldata data) external InStage(Stage.PREPROCESS_MEANS) {
+		emit LocalStats(msg.sender, size, data);
+	}
+
+	function globalUpdate(bytes calldata updatedModel) external OwnerOnly InStage(Stage.TRAINING) {
+		uint32 nextEpoch = epoch + 1;
+		if (eventSourced) {
+			emit GlobalModel(nextEpoch, updatedModel);
+		} else {
+			model = updatedModel;
+		}
+		// Both fields are in the same slot, written together
+		epoch = nextEpoch;
+		dataSize = 0;
+	}
+
+	function globalMeans(bytes calldata data) external OwnerOnly InStage(Stage.PREPROCESS_MEANS) {
+		setMeans(data);
+		stage = Stage.PREPROCESS_STDS;
+	}
+
+	function globalStds(bytes calldata data) external OwnerOnly InStage(Stage.PREPROCESS_STDS) {
+		setStds(data);
+		stage = Stage.TRAINING;
+	}
+
+	function globalStats(bytes calldata meanData, bytes calldata stdData) external OwnerOnly InStage(Stage.PREPROCESS_MEANS) {
+		setMeans(meanData);
+		setStds(stdData);
+		stage = Stage.TRAINING;
+	}
+
+	function setMeans(bytes calldata data) private {
+		if (eventSourced) {
+			emit GlobalMeans(data);
+		} else {
+			means = data;
+		}
+	}
+
+	function setStds(bytes calldata data) private {
+		if (eventSourced) {
+			emit GlobalStds(data);
+		} else {
+			stds = data;
+		}
+	}
+
+	// Public getter methods follow.
+	// In event-sourced mode, model, means and stds are empty and must be read from events.
+
+	function getModel() view external returns(bytes memory) {
+		return model;
+	}
+
+	function getModelChunkCount() pure external returns(uint) {
+		return 0;
+	}
+
+	function getMeans() view external returns(bytes memory) {
+		return means;
+	}
+
+	function getStds() view external returns(bytes memory) {
+		return stds;
+	}
+
+	function getEpoch() view external returns(uint) {
+		return epoch;
+	}
+
+	function getDataSize() view external returns(uint) {
+		return dataSize;
+	}
+}
@@ -11,6 +11,38 @@ class FederatedModel(nn.Module):
     A base class for federated learning models.
     Contains utility methods and operator overloads specialized for federated learning.
     """
+    def flatten(self):
+        """
+        Move all model parameters into a single contiguous buffer.
+        Each parameter becomes a view into this buffer, so that the whole model
+        can be serialized, loaded and averaged with a single array operation.
+        Must be called after the model is converted to its final dtype.
+        """
+        params = list(self.parameters())
+        flat = torch.cat([param.detach().reshape(-1) for param in params])
+        offset = 0
+        for param in params:
+            size = param.numel()
+            param.data = flat[offset:offset+size].view_as(param)
+            offset += size
+        self.flat = flat
+
+    def flat_buffer(self):
+        """
+        Returns the contiguous parameter buffer if all parameters are still views into it.
+        Otherwise (e.g. after deepcopy or dtype conversion) returns None.
+        """
+        flat = getattr(self, "flat", None)
+        if flat is None:
+            return None
+        offset = 0
+        for param in self.parameters():
+            expected = flat.data_ptr() + offset * flat.element_size()
+            if param.data_ptr() != expected:
+                return None
+            offset += param.numel()
+        return flat if offset == flat.numel() else None
+
     def copy_from(self, other):
         """
         Cop model paramateres from other model to this.
@@ -24,6 +56,10 @@ class FederatedModel(nn.Module):
         """
         Set all model parameters to zero.
         """
+        flat = model.flat_buffer()
+        if flat is not None:
+            flat.zero_()
+            return
         for param in model.parameters():
             param.detach().zero_()
 
@@ -46,35 +82,64 @@ class FederatedModel(nn.Module):
         """
         Returns the representation of model in terms of bytes.
         """
-        bytestr = b''
+        flat = self.flat_buffer()
+        if flat is not None:
+            return flat.detach().numpy().astype(EXTERNAL_DTYPE.numpy, copy=False).tobytes()
+        return b''.join(
+                param.detach().numpy().astype(EXTERNAL_DTYPE.numpy, copy=False).tobytes()
+                for param in self.parameters())
+
+    def param_sizes(self):
+        """
+        Number of elements in each parameter tensor, in order.
+        """
+        return [param.numel() for param in self.parameters()]
+
+    def to_numpy(self):
+        """
+        Returns all model parameters as a single flat array.
+        """
+        flat = self.flat_buffer()
+        if flat is not None:
+            return flat.detach().numpy()
+        return np.concatenate([param.detach().numpy().reshape(-1) for param in self.parameters()])
+
+    def from_numpy(self, arr: np.ndarray):
+        """
+        Load the model parameters from a flat array of any float dtype.
+        """
+        flat = self.flat_buffer()
+        if flat is not None:
+            flat.detach().numpy()[:] = arr
+            return
+        offset = 0
         for param in self.parameters():
-            arr = param.detach().numpy().astype(EXTERNAL_DTYPE.numpy)
-            bytestr += arr.tobytes()
-        return bytestr
+            param_arr = param.detach().numpy()
+            param_arr[:] = arr[offset:offset+param_arr.size].reshape(param_arr.shape)
+            offset += param_arr.size
+        assert(offset == arr.size)
 
     def from_bytes(self, bytestr: bytes):
         """
         Load from the byte representation of the model.
         """
-        for param in self.parameters():
-            arr = param.detach().numpy()
-            bytesize = arr.size * EXTERNAL_DTYPE.size
-            arr[:] = np.frombuffer(bytestr[:bytesize], dtype=EXTERNAL_DTYPE.numpy).reshape(arr.shape)
-            bytestr = bytestr[bytesize:]
-        assert(len(bytestr) == 0)
-        return bytestr
+        self.from_numpy(np.frombuffer(bytestr, dtype=EXTERNAL_DTYPE.numpy))
 
     def federate_from_bytes(self, bytestr: bytes, weight):
         """
         Given a byte representation of a model and a weight, add its parameters to this model.
         """
+        flat = self.flat_buffer()
+        if flat is not None:
+            flat.detach().numpy()[:] += weight * np.frombuffer(bytestr, dtype=EXTERNAL_DTYPE.numpy)
+            return
+        offset = 0
         for param in self.parameters():
             arr = param.detach().numpy()
-            bytesize = arr.size * EXTERNAL_DTYPE.size
-            arr += weight * np.frombuffer(bytestr[:bytesize], dtype=EXTERNAL_DTYPE.numpy).reshape(arr.shape)
-            bytestr = bytestr[bytesize:]
-        assert(len(bytestr) == 0)
-        return bytestr
+            arr += weight * np.frombuffer(bytestr, dtype=EXTERNAL_DTYPE.numpy,
+                    count=arr.size, offset=offset).reshape(arr.shape)
+            offset += arr.size * EXTERNAL_DTYPE.size
+        assert(offset == len(bytestr))
 
 
 
@@ -98,3 +163,18 @@ def combine_stds(var: list):
     total = np.sum(np.concatenate([n*mean for n, mean in var]), axis=0, keepdims=True)
     return np.sqrt(total / N)
 
+def combine_stats(stats: list):
+    """
+    Given a list of (n, mean, var) tuples, where var is the variance around the local mean,
+    find the overall mean and std.
+    Uses the pairwise formula of Chan et al., which stays stable in low precision since it
+    never subtracts large sums of squares.
+    """
+    N = sum([n for n, mean, var in stats])
+    means = np.concatenate([mean for n, mean, var in stats]).astype(np.float64)
+    variances = np.concatenate([var for n, mean, var in stats]).astype(np.float64)
+    sizes = np.array([n for n, mean, var in stats], dtype=np.float64).reshape((-1, 1))
+    total_mean = np.sum(sizes * means, axis=0, keepdims=True) / N
+    # Within-client variance plus the variance of the client means
+    total_var = np.sum(sizes * (variances + np.square(means - total_mean)), axis=0, keepdims=True) / N
+    return total_mean, np.sqrt(total_var)
@@ -1,14 +1,20 @@
 """
-This utility checks the gas fees associated with global and local model updates.
+This utility measures the gas used by each contract function for a given byte-size of the
+machine-learning model, and compares the contract variants.
 """
 from web3 import Web3
-from solcx import compile_source
 from eth_tester.exceptions import TransactionFailed
 from eth.exceptions import OutOfGas
 
-dataSize = 10000
+from contract_cache import compile_contract
+
+# Model sizes in bytes to benchmark
+modelSizes = [1, 10, 100, 1000, 10000, 20000, 30000, 40000, 50000]
+# Number of local updates per round, for the per-round estimate
+localUpdates = 10
+
 dataNum = 0
-def getBinaryData():
+def getBinaryData(dataSize):
     global dataNum
     binaryData = (str(dataNum).encode() + b' ') * dataSize
     binaryData = binaryData[:dataSize]
@@ -16,12 +22,12 @@ def getBinaryData():
     dataNum += 1
     return binaryData
 
-with open("FL.sol", 'r') as f:
-    solidity_code = f.read()
-compiled_sol = compile_source(solidity_code, output_values=['abi', 'bin'])
-contract_id, contract_interface = compiled_sol.popitem()
-bytecode = contract_interface['bin']
-abi = contract_interface['abi']
+# Contract variants: name, source file, extra constructor arguments
+variants = [
+    ("FL.sol", "FL.sol", []),
+    ("FLOptimized.sol", "FLOptimized.sol", [False]),
+    ("FLOptimized.sol (event sourced)", "FLOptimized.sol", [True]),
+    ]
 
 # web3.py instance
 w3 = Web3(Web3.EthereumTesterProvider())
@@ -29,103 +35,76 @@ w3 = Web3(Web3.EthereumTesterProvider())
 # set pre-funded account as sender
 my_account = w3.eth.accounts[1]
 w3.eth.default_account = my_account
-print("Initial balance before all operations:", w3.eth.get_balance(my_account))
-
-FL = w3.eth.contract(abi=abi, bytecode=bytecode)
-
-print("Creating the contract")
-# Submit the transaction that deploys the contract
-tx_hash = FL.constructor(b'').transact()
-
-# Wait for the transaction to be mined, and get the transaction receipt
-tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-
-contract = w3.eth.contract(
-    address=tx_receipt.contractAddress,
-    abi=abi)
-
-print("Contract created")
 
-def printContractState():
-    print("Contract state:")
-    print("\tEpoch:", contract.functions.getEpoch().call())
-    print("\tData size:", contract.functions.getDataSize().call())
-    print("\tModel:", contract.functions.getModel().call()[:100], "...")
-    print()
-printContractState()
 
-def printEventLog(log):
-    print("Event log:")
-    print("\tEpoch:", log["args"]["epoch"])
-    print("\tData size:", log["args"]["size"])
-    print("\tModel:", log["args"]["model"][:100], "...")
-
-def passPreprocess():
+def transact(function):
     """
-    Pass the preprocess stage of the contract.
+    Send the transaction and return the gas used.
     """
-    tx_hash = contract.functions.globalMeans(b'').transact()
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    tx_hash = contract.functions.globalStds(b'').transact()
+    tx_hash = function.transact()
     tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    return tx_receipt["gasUsed"]
 
-def stressTest():
-    starting_balance = w3.eth.get_balance(my_account)
-    print("Starting balance:", starting_balance)
 
-    print("Sending global update")
-    tx_hash = contract.functions.globalUpdate(getBinaryData()).transact()
+def deploy(abi, bytecode, *vargs):
+    FL = w3.eth.contract(abi=abi, bytecode=bytecode)
+    tx_hash = FL.constructor(*vargs).transact()
     tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    print("Gas used:", tx_receipt["gasUsed"])
-    print("diff:", starting_balance - w3.eth.get_balance(my_account))
-    printContractState()
-
-    print("\nMultiple local updates")
-    receipts = [w3.eth.wait_for_transaction_receipt(contract.functions.localUpdate(1, 10, getBinaryData()).transact()) for i in range(4)]
-    for tx_receipt in receipts:
-        print("Gas used:", tx_receipt["gasUsed"])
-        logs = contract.events.LocalUpdate().processReceipt(tx_receipt)
-        assert(len(logs) == 1)
-        printEventLog(logs[0])
-
-    print("Sending global update")
-    tx_hash = contract.functions.globalUpdate(getBinaryData()).transact()
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    print("Gas used:", tx_receipt["gasUsed"])
-    printContractState()
-
-    ending_balance = w3.eth.get_balance(my_account)
-    print("Final balance:", ending_balance)
-    print("Difference:", starting_balance-ending_balance)
-
-def estimateGasFees():
-    # Estimated gas fees are pretty accurate
-    print("Estimated gas fees:")
-    globalGas = contract.functions.globalUpdate(getBinaryData()).estimateGas()
-    localGas = contract.functions.localUpdate(0, 666, getBinaryData()).estimateGas()
-    print("\tGlobal update:", globalGas)
-    print("\tLocal update:", localGas)
-    overall = 10*localGas + globalGas
-    print("\t10 local + 1 global:", overall)
-    return overall
-
-
-passPreprocess()
-# stressTest()
-
-if True:
-    stressTest()
-else:
-    dataSize = 1
-    print("For model size = %d" %(dataSize))
-    baseGas = estimateGasFees()
-    print()
-
-    for dataSize in [10, 100, 1000, 10000, 20000, 30000, 40000, 50000]:
+    contract = w3.eth.contract(address=tx_receipt.contractAddress, abi=abi)
+    return contract, tx_receipt["gasUsed"]
+
+
+def measure(abi, bytecode, extraArgs, dataSize):
+    """
+    Deploy a fresh contract and measure the gas used by each function with the given model size.
+    Returns a dict from function name to gas.
+    """
+    gas = {}
+    contract, gas["deploy"] = deploy(abi, bytecode, getBinaryData(dataSize), *extraArgs)
+    functions = contract.functions
+    featureData = getBinaryData(min(dataSize, 1000))
+    gas["localMeans"] = transact(functions.localMeans(666, featureData))
+    gas["globalMeans"] = transact(functions.globalMeans(featureData))
+    gas["localStds"] = transact(functions.localStds(666, featureData))
+    gas["globalStds"] = transact(functions.globalStds(featureData))
+    gas["localUpdate"] = transact(functions.localUpdate(0, 666, getBinaryData(dataSize)))
+    # First global update writes to fresh storage, the next ones overwrite it
+    gas["globalUpdate"] = transact(functions.globalUpdate(getBinaryData(dataSize)))
+    gas["globalUpdate (overwrite)"] = transact(functions.globalUpdate(getBinaryData(dataSize)))
+    gas["round"] = localUpdates * gas["localUpdate"] + gas["globalUpdate (overwrite)"]
+    return gas
+
+
+def benchmark():
+    results = {}
+    for name, filename, extraArgs in variants:
+        contract_id, abi, bytecode = compile_contract(filename)
+        results[name] = {}
+        for dataSize in modelSizes:
+            try:
+                results[name][dataSize] = measure(abi, bytecode, extraArgs, dataSize)
+            except (OutOfGas, TransactionFailed, ValueError) as e:
+                print(f"{name}: out of gas at model size {dataSize} ({type(e).__name__})")
+                break
+    return results
+
+
+def printResults(results):
+    baseline = results[variants[0][0]]
+    for dataSize in modelSizes:
         print("For model size = %d" %(dataSize))
-        try:
-            gas = estimateGasFees()
-            print("\tRatio to base gas:", gas/baseGas)
-        except OutOfGas:
-            print("\tOut of gas!")
-            break
+        for name, gasTable in results.items():
+            if dataSize not in gasTable:
+                print(f"\t{name}: out of gas")
+                continue
+            print(f"\t{name}:")
+            for function, gas in gasTable[dataSize].items():
+                line = f"\t\t{function}: {gas}"
+                if name != variants[0][0] and dataSize in baseline:
+                    line += f" ({gas / baseline[dataSize][function] * 100.0:.1f}% of {variants[0][0]})"
+                print(line)
+        print()
+    print(f"Round = {localUpdates} local updates + 1 global update")
+
+
+printResults(benchmark())
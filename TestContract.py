@@ -2,23 +2,13 @@
 Tests the functionality of federated learning contract
 """
 from web3 import Web3
-from solcx import compile_source
+from web3.exceptions import ContractLogicError
 from eth_tester.exceptions import TransactionFailed
 
-with open("FL.sol", 'r') as f:
-    solidity_code = f.read()
+from contract_cache import compile_contract
 
-# Solidity source code
-compiled_sol = compile_source(solidity_code, output_values=['abi', 'bin'])
-
-# retrieve the contract interface
-contract_id, contract_interface = compiled_sol.popitem()
-
-# get bytecode / bin
-bytecode = contract_interface['bin']
-
-# get abi
-abi = contract_interface['abi']
+# Compile the contract, or load it from the cache
+contract_id, abi, bytecode = compile_contract("FL.sol")
 
 # web3.py instance
 w3 = Web3(Web3.EthereumTesterProvider())
@@ -113,3 +103,213 @@ tx_hash = contract.functions.globalUpdate(b'Another GLOBAL update').transact()
 tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
 printContractState()
 
+
+
+
+# The following checks deploy their own contracts, for both FL.sol and FLOptimized.sol.
+# FLOptimized.sol reverts with custom errors instead of revert strings.
+owner = w3.eth.accounts[0]
+other = w3.eth.accounts[1]
+TRAINING = 2
+
+def deploy(filename, *args):
+    """
+    Compile and deploy the given contract from the owner account.
+    """
+    contract_id, abi, bytecode = compile_contract(filename)
+    tx_hash = w3.eth.contract(abi=abi, bytecode=bytecode).constructor(*args).transact({"from": owner})
+    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    return w3.eth.contract(address=tx_receipt.contractAddress, abi=abi)
+
+def transact(function, sender=owner):
+    return w3.eth.wait_for_transaction_receipt(function.transact({"from": sender}))
+
+def expectRevert(description, action):
+    """
+    Run the action, which must fail with a revert.
+    """
+    try:
+        action()
+    except (TransactionFailed, ContractLogicError) as e:
+        print(f"{description} failed as expected:", e)
+        return
+    raise AssertionError(f"{description} succeeded")
+
+def checkSingleRoundPreprocess(filename, *args):
+    """
+    localStats is only accepted in the means stage, globalStats goes straight to training.
+    """
+    print(f"\nSingle-round preprocessing in {filename}")
+    contract = deploy(filename, *args)
+    tx_receipt = transact(contract.functions.localStats(5, b'local stats'), other)
+    logs = contract.events.LocalStats().processReceipt(tx_receipt)
+    assert(len(logs) == 1 and logs[0]["args"]["size"] == 5 and logs[0]["args"]["data"] == b'local stats')
+    expectRevert("globalStats by another account",
+            lambda: transact(contract.functions.globalStats(b'means', b'stds'), other))
+    transact(contract.functions.globalStats(b'means', b'stds'))
+    assert(contract.functions.stage().call() == TRAINING)
+    expectRevert("localStats in training stage",
+            lambda: transact(contract.functions.localStats(5, b'late stats'), other))
+    expectRevert("globalStats in training stage",
+            lambda: transact(contract.functions.globalStats(b'means', b'stds')))
+    # Two-round preprocessing: stats are rejected in the stds stage too
+    contract = deploy(filename, *args)
+    transact(contract.functions.globalMeans(b'means'))
+    expectRevert("localStats in stds stage",
+            lambda: transact(contract.functions.localStats(5, b'stats'), other))
+    expectRevert("globalStats in stds stage",
+            lambda: transact(contract.functions.globalStats(b'means', b'stds')))
+    return contract
+
+def checkStaleness(filename, *args):
+    """
+    Local updates are accepted within the staleness window, and never from future epochs.
+    """
+    print(f"\nStaleness window in {filename}")
+    contract = deploy(filename, *args)
+    transact(contract.functions.globalMeans(b''))
+    transact(contract.functions.globalStds(b''))
+    for i in range(3):
+        transact(contract.functions.globalUpdate(b'model %d' % i))
+    assert(contract.functions.getEpoch().call() == 3)
+    expectRevert("Stale update without staleness window",
+            lambda: transact(contract.functions.localUpdate(2, 1, b'stale'), other))
+    expectRevert("setMaxStaleness by another account",
+            lambda: transact(contract.functions.setMaxStaleness(2), other))
+    transact(contract.functions.setMaxStaleness(2))
+    assert(contract.functions.maxStaleness().call() == 2)
+    for localEpoch in (1, 2, 3):
+        transact(contract.functions.localUpdate(localEpoch, 1, b'fresh'), other)
+        transact(contract.functions.localUpdateChunk(localEpoch, 0, b'fresh chunk'), other)
+    assert(contract.functions.getDataSize().call() == 3)
+    for localEpoch in (0, 4):
+        expectRevert(f"Update of epoch {localEpoch} at epoch 3",
+                lambda: transact(contract.functions.localUpdate(localEpoch, 1, b'outside'), other))
+        expectRevert(f"Update chunk of epoch {localEpoch} at epoch 3",
+                lambda: transact(contract.functions.localUpdateChunk(localEpoch, 0, b'outside'), other))
+
+def checkChunkedModel():
+    """
+    Chunked global model upload of FL.sol: double buffered chunks are overwritten or pushed,
+    and finalizing requires all chunks.
+    """
+    print("\nChunked global model in FL.sol")
+    contract = deploy("FL.sol", b'genesis model')
+    def upload(chunks, epoch):
+        transact(contract.functions.beginGlobalUpdate())
+        for chunk in chunks:
+            transact(contract.functions.appendGlobalUpdate(chunk))
+        transact(contract.functions.finalizeGlobalUpdate(len(chunks)))
+        assert(contract.functions.getEpoch().call() == epoch)
+        assert(contract.functions.getModelChunkCount().call() == len(chunks))
+        for i, chunk in enumerate(chunks):
+            assert(contract.functions.getModelChunk(i).call() == chunk)
+        expectRevert("Reading a chunk out of range",
+                lambda: contract.functions.getModelChunk(len(chunks)).call())
+
+    # Before training, finalizing only sets the initial model
+    upload([b'initial 0', b'initial 1'], 0)
+    transact(contract.functions.globalMeans(b''))
+    transact(contract.functions.globalStds(b''))
+    # Fills the other buffer, then overwrites the chunks of the first one and pushes a new one
+    upload([b'first 0', b'first 1', b'first 2', b'first 3'], 1)
+    upload([b'second 0', b'second 1', b'second 2'], 2)
+    # Overwrites part of the longer buffer, the older chunks beyond the count are not visible
+    upload([b'third 0'], 3)
+
+    transact(contract.functions.beginGlobalUpdate())
+    transact(contract.functions.appendGlobalUpdate(b'partial 0'))
+    transact(contract.functions.appendGlobalUpdate(b'partial 1'))
+    expectRevert("Finalizing with a missing chunk",
+            lambda: transact(contract.functions.finalizeGlobalUpdate(3)))
+    expectRevert("Appending a chunk from another account",
+            lambda: transact(contract.functions.appendGlobalUpdate(b'illegal'), other))
+    # The failed finalize didn't change the model
+    assert(contract.functions.getEpoch().call() == 3)
+    assert(contract.functions.getModelChunk(0).call() == b'third 0')
+
+    # A plain global update replaces the chunked model
+    transact(contract.functions.globalUpdate(b'plain model'))
+    assert(contract.functions.getModelChunkCount().call() == 0)
+    assert(contract.functions.getModel().call() == b'plain model')
+    expectRevert("Reading a chunk of a plain model", lambda: contract.functions.getModelChunk(0).call())
+
+    tx_receipt = transact(contract.functions.localUpdateChunk(4, 7, b'update chunk'), other)
+    logs = contract.events.LocalUpdateChunk().processReceipt(tx_receipt)
+    assert(len(logs) == 1)
+    assert(logs[0]["args"]["epoch"] == 4 and logs[0]["args"]["index"] == 7 and logs[0]["args"]["data"] == b'update chunk')
+
+def checkOptimized(eventSourced):
+    """
+    Stage and owner checks of FLOptimized.sol, and reading the global values back from
+    storage or, in event-sourced mode, from events.
+    """
+    print(f"\nOptimized contract, event sourced: {eventSourced}")
+    contract = deploy("FLOptimized.sol", b'genesis model', eventSourced)
+    assert(contract.functions.eventSourced().call() == eventSourced)
+    assert(contract.functions.owner().call() == owner)
+    fromBlock = w3.eth.block_number
+
+    def globalModel(epoch):
+        if not eventSourced:
+            return contract.functions.getModel().call()
+        logs = contract.events.GlobalModel.getLogs(fromBlock=0, argument_filters={"epoch": epoch})
+        assert(len(logs) == 1)
+        return logs[0]["args"]["model"]
+
+    def lastGlobal(event, getter):
+        if not eventSourced:
+            return getter().call()
+        assert(getter().call() == b'')
+        return event.getLogs(fromBlock=fromBlock)[-1]["args"]["data"]
+
+    assert(globalModel(0) == b'genesis model')
+    if eventSourced:
+        assert(contract.functions.getModel().call() == b'')
+
+    expectRevert("localUpdate in means stage",
+            lambda: transact(contract.functions.localUpdate(0, 1, b'early'), other))
+    expectRevert("localStds in means stage",
+            lambda: transact(contract.functions.localStds(1, b'early'), other))
+    expectRevert("globalStds in means stage",
+            lambda: transact(contract.functions.globalStds(b'stds')))
+    expectRevert("globalMeans by another account",
+            lambda: transact(contract.functions.globalMeans(b'means'), other))
+    transact(contract.functions.localMeans(3, b'local means'), other)
+    transact(contract.functions.globalMeans(b'global means'))
+    assert(contract.functions.stage().call() == 1)
+    assert(lastGlobal(contract.events.GlobalMeans, contract.functions.getMeans) == b'global means')
+    expectRevert("localMeans in stds stage",
+            lambda: transact(contract.functions.localMeans(3, b'late'), other))
+    expectRevert("globalUpdate in stds stage",
+            lambda: transact(contract.functions.globalUpdate(b'early model')))
+    transact(contract.functions.localStds(3, b'local stds'), other)
+    transact(contract.functions.globalStds(b'global stds'))
+    assert(contract.functions.stage().call() == TRAINING)
+    assert(lastGlobal(contract.events.GlobalStds, contract.functions.getStds) == b'global stds')
+
+    tx_receipt = transact(contract.functions.localUpdate(0, 666, b'local update'), other)
+    logs = contract.events.LocalUpdate().processReceipt(tx_receipt)
+    assert(len(logs) == 1 and logs[0]["args"]["from"] == other and logs[0]["args"]["epoch"] == 0)
+    assert(contract.functions.getDataSize().call() == 666)
+    expectRevert("Local update size that overflows",
+            lambda: transact(contract.functions.localUpdate(0, 2**56, b'huge'), other))
+    expectRevert("globalUpdate by another account",
+            lambda: transact(contract.functions.globalUpdate(b'illegal model'), other))
+    transact(contract.functions.globalUpdate(b'model 1'))
+    assert(contract.functions.getEpoch().call() == 1)
+    assert(contract.functions.getDataSize().call() == 0)
+    assert(globalModel(1) == b'model 1')
+    assert(globalModel(0) == b'genesis model' or not eventSourced)
+    expectRevert("Local update of the previous epoch",
+            lambda: transact(contract.functions.localUpdate(0, 1, b'stale'), other))
+    assert(contract.functions.getModelChunkCount().call() == 0)
+
+checkSingleRoundPreprocess("FL.sol", b'genesis model')
+checkSingleRoundPreprocess("FLOptimized.sol", b'genesis model', False)
+checkStaleness("FL.sol", b'genesis model')
+checkStaleness("FLOptimized.sol", b'genesis model', False)
+checkChunkedModel()
+checkOptimized(False)
+checkOptimized(True)
+print("\nAll checks passed")
@@ -43,13 +43,43 @@ def load_config(filename):
         log.info(f"Read config file: {config_filename}")
 
     global PLATFORM_NAME, NUM_USERS, LOCAL_EPOCHS, GLOBAL_EPOCHS
-    global PREPROCESSING_FRACTION, TRAINING_FRACTION
+    global PREPROCESSING_FRACTION, TRAINING_FRACTION, PREPROCESSING_ROUNDS
     PLATFORM_NAME = config["FL"]["platform"]
     NUM_USERS     = config["FL"].getint("num users")
     LOCAL_EPOCHS  = config["FL"].getint("local epochs")
     GLOBAL_EPOCHS = config["FL"].getint("global epochs")
     PREPROCESSING_FRACTION = config["FL"].getfloat("preprocessing fraction")
     TRAINING_FRACTION      = config["FL"].getfloat("training fraction")
+    PREPROCESSING_ROUNDS   = config["FL"].getint("preprocessing rounds", fallback=2)
+    if PREPROCESSING_ROUNDS not in (1, 2):
+        raise ValueError(f"Preprocessing rounds must be 1 or 2, got {PREPROCESSING_ROUNDS}")
+
+    global PARTITION, PARTITION_ALPHA
+    PARTITION       = config["FL"].get("partition", fallback="iid")
+    PARTITION_ALPHA = config["FL"].getfloat("partition alpha", fallback=0.5)
+
+    global AGGREGATION, WORKERS, BATCHED_CLIENTS
+    AGGREGATION = config["FL"].get("aggregation", fallback="batch")
+    if AGGREGATION not in ("batch", "stream"):
+        raise ValueError(f"Unknown aggregation mode: {AGGREGATION}")
+    WORKERS     = config["FL"].getint("workers", fallback=0)
+    BATCHED_CLIENTS = config["FL"].getboolean("batched clients", fallback=False)
+
+    global ASYNC_TRAINING, BUFFER_SIZE, MAX_STALENESS, STALENESS_EXPONENT, SPEED_SIGMA
+    ASYNC_TRAINING     = config["FL"].getboolean("async", fallback=False)
+    BUFFER_SIZE        = config["FL"].getint("buffer size", fallback=3)
+    MAX_STALENESS      = config["FL"].getint("max staleness", fallback=4)
+    STALENESS_EXPONENT = config["FL"].getfloat("staleness exponent", fallback=0.5)
+    SPEED_SIGMA        = config["FL"].getfloat("speed sigma", fallback=0.5)
+    if ASYNC_TRAINING and (BATCHED_CLIENTS or WORKERS > 0):
+        raise ValueError("Asynchronous training trains clients sequentially, without workers or batching")
+    if ASYNC_TRAINING and (BUFFER_SIZE < 1 or MAX_STALENESS < 1):
+        raise ValueError("Asynchronous training needs a buffer size and a max staleness of at least 1")
+
+    global EDGE_GROUP_SIZE
+    EDGE_GROUP_SIZE = config["FL"].getint("edge group size", fallback=0)
+    if ASYNC_TRAINING and EDGE_GROUP_SIZE > 0:
+        raise ValueError("Edge aggregation is not supported in asynchronous training")
 
     global LEARNING_RATE, MOMENTUM, BATCH_SIZE, TEST_BATCH_SIZE
     LEARNING_RATE   = config["ML"].getfloat("learning rate")
@@ -57,21 +87,59 @@ def load_config(filename):
     BATCH_SIZE      = config["ML"].getint("batch size")
     TEST_BATCH_SIZE = config["ML"].getint("test batch size")
 
-    global INTERNAL_DTYPE, EXTERNAL_DTYPE
+    global INTERNAL_DTYPE, EXTERNAL_DTYPE, FLAT_PARAMETERS
     INTERNAL_DTYPE  = getFloatDtype(config["DATATYPES"].getint("internal"))
     EXTERNAL_DTYPE  = getFloatDtype(config["DATATYPES"].getint("external"))
-
-    global DATASET_FILENAME, VALIDATION_SIZE
+    FLAT_PARAMETERS = config["DATATYPES"].getboolean("flat parameters", fallback=True)
+
+    global CODEC, DELTA_ENCODING, ERROR_FEEDBACK, TOPK_FRACTION, ENCODE_UPDATES
+    CODEC           = config["DATATYPES"].get("codec", fallback="float")
+    DELTA_ENCODING  = config["DATATYPES"].getboolean("delta encoding", fallback=False)
+    ERROR_FEEDBACK  = config["DATATYPES"].getboolean("error feedback", fallback=True)
+    TOPK_FRACTION   = config["DATATYPES"].getfloat("topk fraction", fallback=0.01)
+    if CODEC == "topk" and not DELTA_ENCODING:
+        raise ValueError("topk codec requires delta encoding")
+    # Plain float updates without delta encoding are sent as raw bytes, without a header
+    ENCODE_UPDATES  = CODEC != "float" or DELTA_ENCODING
+
+    global DATASET_FILENAME, VALIDATION_SIZE, DATASET_CACHE, CHUNK_SIZE
     DATASET_FILENAME = config["INPUT"]["dataset path"]
     VALIDATION_SIZE  = config["INPUT"].getfloat("validation size")
+    DATASET_CACHE    = config["INPUT"].get("cache directory", fallback=".dataset_cache")
+    CHUNK_SIZE       = config["INPUT"].getint("chunk size", fallback=0)
 
     global MODEL_NAME, MODEL_ARGS
     MODEL_NAME = config["MODEL"]["name"]
     MODEL_ARGS = config["MODEL"]
 
-    global EVAL_PER_EPOCH, RESULTS_FILE
+    # Options of the Ethereum platform
+    global BLOB_STORE, UPLOAD_CHUNK_SIZE, OPTIMIZED_CONTRACT, EVENT_SOURCED, ASYNC_TRANSACTIONS
+    global READ_CACHE, AUTO_MINE, MINING_BATCH_SIZE
+    BLOB_STORE         = config.get("ETH", "blob store", fallback="")
+    UPLOAD_CHUNK_SIZE  = config.getint("ETH", "upload chunk size", fallback=0)
+    OPTIMIZED_CONTRACT = config.getboolean("ETH", "optimized contract", fallback=False)
+    EVENT_SOURCED      = config.getboolean("ETH", "event sourced", fallback=False)
+    ASYNC_TRANSACTIONS = config.getboolean("ETH", "async transactions", fallback=True)
+    READ_CACHE         = config.getboolean("ETH", "read cache", fallback=True)
+    AUTO_MINE          = config.getboolean("ETH", "auto mine", fallback=True)
+    MINING_BATCH_SIZE  = config.getint("ETH", "mining batch size", fallback=0)
+    global CONTRACT_CACHE, SOLC_OPTIMIZE, SOLC_OPTIMIZE_RUNS
+    CONTRACT_CACHE     = config.get("ETH", "contract cache", fallback=".contract_cache")
+    SOLC_OPTIMIZE      = config.getboolean("ETH", "optimizer", fallback=False)
+    SOLC_OPTIMIZE_RUNS = config.getint("ETH", "optimizer runs", fallback=200)
+    if EVENT_SOURCED and not OPTIMIZED_CONTRACT:
+        raise ValueError("Event-sourced mode requires the optimized contract")
+    if OPTIMIZED_CONTRACT and UPLOAD_CHUNK_SIZE > 0:
+        raise ValueError("Chunked uploads are not supported by the optimized contract")
+    if ASYNC_TRAINING and UPLOAD_CHUNK_SIZE > 0:
+        raise ValueError("Chunked uploads are not supported in asynchronous training")
+
+    global EVAL_PER_EPOCH, EVALUATE_EVERY, BACKGROUND_EVALUATION, RESULTS_FILE, PROFILE
     EVAL_PER_EPOCH = config["TESTING"].getboolean("evaluate per epoch")
+    EVALUATE_EVERY = config["TESTING"].getint("evaluate every", fallback=1)
+    BACKGROUND_EVALUATION = config["TESTING"].getboolean("background evaluation", fallback=False)
     RESULTS_FILE   = config["TESTING"]["results file"]
+    PROFILE        = config["TESTING"].getboolean("profile", fallback=True)
 
     global RANDOM_SEED
     RANDOM_SEED = config["INPUT"].getint("random seed")
@@ -0,0 +1,52 @@
+"""
+Cache of compiled contracts, so that the Solidity compiler doesn't run on every launch.
+Each artifact is a JSON file with the ABI and bytecode, keyed by the hash of the source,
+the solc version and the optimizer settings.
+"""
+import os
+import json
+import hashlib
+
+from solcx import compile_source, get_solc_version
+
+from util import atomic_write
+
+
+DEFAULT_CACHE_DIR = ".contract_cache"
+
+
+def artifact_key(source: str, solc_version: str, optimize: bool, optimize_runs: int):
+    settings = json.dumps([solc_version, optimize, optimize_runs])
+    return hashlib.sha256(settings.encode() + b'\0' + source.encode()).hexdigest()
+
+
+def compile_contract(filename, optimize=False, optimize_runs=200, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Compile the contract in the given .sol file, or load it from the cache.
+    Empty cache_dir disables the cache.
+    Returns the (contract_id, abi, bytecode) tuple.
+    """
+    with open(filename, 'r') as f:
+        source = f.read()
+
+    path = None
+    if cache_dir:
+        key = artifact_key(source, str(get_solc_version()), optimize, optimize_runs)
+        path = os.path.join(cache_dir, key + ".json")
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                artifact = json.load(f)
+            return artifact["contract_id"], artifact["abi"], artifact["bin"]
+
+    kwargs = {"optimize": True, "optimize_runs": optimize_runs} if optimize else {}
+    compiled_sol = compile_source(source, output_values=['abi', 'bin'], **kwargs)
+    # retrieve the contract interface
+    contract_id, contract_interface = compiled_sol.popitem()
+    abi = contract_interface['abi']
+    bytecode = contract_interface['bin']
+
+    if path is not None:
+        # Concurrent runs never see a partial artifact
+        with atomic_write(path, 'w') as f:
+            json.dump({"contract_id": contract_id, "abi": abi, "bin": bytecode}, f)
+    return contract_id, abi, bytecode
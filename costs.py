@@ -0,0 +1,53 @@
+"""
+Accounting of the blockchain costs of federated learning.
+Gas used, bytes posted by kind of payload and transaction count are aggregated per round
+and per account, so that they can be saved next to the accuracies.
+"""
+from collections import defaultdict
+
+
+# Kinds of the payloads posted on blockchain
+KINDS = ("update", "means", "stds", "stats", "global_model", "global_means", "global_stds")
+
+
+class CostTracker:
+    def __init__(self):
+        self.rounds = []
+        self.reset()
+
+    def reset(self):
+        self.accounts = defaultdict(lambda: defaultdict(int))
+
+    def transaction(self, account):
+        self.accounts[str(account)]["transactions"] += 1
+
+    def posted(self, account, kind, size):
+        """
+        Count the bytes of a payload of given kind posted by the account.
+        """
+        assert(kind in KINDS)
+        self.accounts[str(account)][kind + "_bytes"] += size
+
+    def gas(self, account, gasUsed):
+        self.accounts[str(account)]["gas"] += gasUsed
+
+    def endRound(self):
+        """
+        Close the current round, costs after this are counted in the next one.
+        """
+        accounts = {account: dict(costs) for account, costs in self.accounts.items()}
+        total = defaultdict(int)
+        for costs in accounts.values():
+            for name, value in costs.items():
+                total[name] += value
+        self.rounds.append({"accounts": accounts, "total": dict(total)})
+        self.reset()
+
+    def results(self):
+        """
+        Per-round records, the first one contains the costs of deployment and preprocessing.
+        """
+        return self.rounds
+
+
+costs = CostTracker()
@@ -1,9 +1,10 @@
 import numpy as np
 import torch
-from torch.utils.data import TensorDataset, DataLoader
-from torch.utils.data.sampler import SubsetRandomSampler 
+from torch.utils.data import TensorDataset
 
 from . preprocess import DataPreprocessor
+from . partition import partition_iid, partition_quantity, partition_dirichlet, ensure_min_size
+from log import log
 from config import INTERNAL_DTYPE
 
 from dataclasses import dataclass
@@ -21,8 +22,53 @@ class Dataset:
     num_labels: int
 
 
-def load_dataset(filename, test_size=0.2):
-    preprocessor = DataPreprocessor(test_size)
+class ClientData:
+    """
+    Local dataset of a single user, stored as contiguous X and y tensors.
+    Iterating over it yields shuffled (X, y) batches like a DataLoader, but each epoch
+    needs a single gather instead of one __getitem__ call and collation per sample.
+    """
+    def __init__(self, X: torch.Tensor, y: torch.Tensor, batch_size: int):
+        self.X = X.contiguous()
+        self.y = y.contiguous()
+        self.batch_size = batch_size
+
+    @property
+    def size(self):
+        """
+        Number of samples.
+        """
+        return self.X.shape[0]
+
+    def __len__(self):
+        """
+        Number of batches, same as len(DataLoader).
+        """
+        return (self.size + self.batch_size - 1) // self.batch_size
+
+    def standardized(self, means: torch.Tensor, stds: torch.Tensor):
+        """
+        Returns a copy of this dataset with standardized X.
+        """
+        return ClientData((self.X - means) / stds, self.y, self.batch_size)
+
+    def __iter__(self):
+        # Shuffle once per epoch, then every batch is a contiguous slice
+        permutation = torch.randperm(self.size)
+        X = self.X[permutation]
+        y = self.y[permutation]
+        for start in range(0, self.size, self.batch_size):
+            yield X[start:start+self.batch_size], y[start:start+self.batch_size]
+
+
+def load_dataset(filename, test_size=0.2, cache_dir=None, chunk_size=0):
+    """
+    Load and preprocess the given CSV file.
+    If cache_dir is given, preprocessed arrays are cached there for the next runs.
+    If chunk_size is positive, CSV is streamed in chunks of that many rows.
+    """
+    preprocessor = DataPreprocessor(test_size, dtype=INTERNAL_DTYPE.numpy,
+            cache_dir=cache_dir, chunk_size=chunk_size)
 
     X_train, X_test, Y_train, Y_test = preprocessor.fit_load(filename)
 
@@ -45,20 +91,40 @@ def load_dataset(filename, test_size=0.2):
 
 
 # Divide data to users
-def split_data_equal(dataset, groups, BATCH_SIZE):
+def split_data(dataset, groups, BATCH_SIZE, method="iid", alpha=0.5, min_size=1):
     """
-    Split the given dataset to the given number of equal parts.
-    Returns a list of dataloaders.
+    Split the given dataset between the given number of users.
+    method is one of:
+    - iid: equal parts with uniformly random samples.
+    - quantity: Dirichlet distributed part sizes with uniformly random samples.
+    - dirichlet: Dirichlet distributed label proportions in each part.
+    alpha is the concentration parameter of the Dirichlet distribution.
+    Every user gets at least min_size samples, raises ValueError if there are too few.
+    Returns a list of ClientData.
     """
-    chunk_size = len(dataset) // groups
-    # group_indices = []
-    dataloaders = []
-    remaining = np.arange(len(dataset))
-    for i in range(groups):
-        indices = np.random.choice(remaining, chunk_size, replace=False)
-        sampler = SubsetRandomSampler(indices)
-        dataloaders.append(DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=False, sampler=sampler))
-        remaining = list(set(remaining) - set(indices))
-    return dataloaders
+    if method == "iid":
+        parts = partition_iid(len(dataset), groups)
+    elif method == "quantity":
+        parts = partition_quantity(len(dataset), groups, alpha)
+    elif method == "dirichlet":
+        labels = dataset.tensors[1].numpy()
+        parts = partition_dirichlet(labels, groups, alpha)
+    else:
+        raise ValueError(f"Unknown partitioning method: {method}")
+
+    small = sum(1 for indices in parts if len(indices) < min_size)
+    if small:
+        log.warning(f"{small} user(s) got fewer than {min_size} sample(s) with {method} partitioning, "
+                "moving samples from the largest parts. Consider a larger alpha")
+        parts = ensure_min_size(parts, min_size)
+
+    X, y = dataset.tensors
+    return [ClientData(X[indices], y[indices], BATCH_SIZE) for indices in parts]
 
 
+def split_data_equal(dataset, groups, BATCH_SIZE):
+    """
+    Split the given dataset to the given number of equal parts.
+    Returns a list of ClientData.
+    """
+    return split_data(dataset, groups, BATCH_SIZE, "iid")
@@ -0,0 +1,80 @@
+"""
+Partition the indices of a dataset between users.
+All partitioners run in linear time with array operations on a single permutation.
+Random state is taken from numpy, which is seeded in config.
+"""
+import numpy as np
+
+
+def partition_iid(n: int, groups: int, rng=np.random):
+    """
+    Split n indices into the given number of equal, uniformly random parts.
+    Remaining indices that don't fit into equal parts are dropped.
+    Returns a list of index arrays.
+    """
+    chunk_size = n // groups
+    permutation = rng.permutation(n)
+    return np.split(permutation[:chunk_size * groups], groups)
+
+
+def partition_quantity(n: int, groups: int, alpha: float, rng=np.random):
+    """
+    Quantity-skewed split: sizes of the parts are drawn from a Dirichlet distribution
+    with the given concentration. Smaller alpha means more uneven sizes.
+    Label distribution of each part is still uniform.
+    Returns a list of index arrays.
+    """
+    proportions = rng.dirichlet(np.full(groups, alpha))
+    cuts = (np.cumsum(proportions) * n).astype(int)[:-1]
+    return np.split(rng.permutation(n), cuts)
+
+
+def partition_dirichlet(labels: np.ndarray, groups: int, alpha: float, rng=np.random):
+    """
+    Label-skewed split: for each class, the fraction of its samples given to each part
+    is drawn from a Dirichlet distribution with the given concentration.
+    Smaller alpha means each part contains fewer classes.
+    Returns a list of index arrays.
+    """
+    n = len(labels)
+    # Shuffle, then group the indices by class with a stable sort
+    permutation = rng.permutation(n)
+    order = permutation[np.argsort(labels[permutation], kind="stable")]
+    class_sizes = np.bincount(labels)
+    class_starts = np.concatenate(([0], np.cumsum(class_sizes)))
+
+    parts = [[] for _ in range(groups)]
+    for c, size in enumerate(class_sizes):
+        if size == 0:
+            continue
+        proportions = rng.dirichlet(np.full(groups, alpha))
+        cuts = (np.cumsum(proportions) * size).astype(int)[:-1]
+        class_indices = order[class_starts[c]:class_starts[c+1]]
+        for part, indices in zip(parts, np.split(class_indices, cuts)):
+            part.append(indices)
+    return [np.concatenate(part) for part in parts]
+
+
+def ensure_min_size(parts, min_size: int, rng=np.random):
+    """
+    Move random samples from the largest parts to the parts with fewer than min_size samples,
+    so that skewed partitions don't leave users without data.
+    Raises ValueError if there are not enough samples for min_size in every part.
+    Returns a list of index arrays.
+    """
+    sizes = np.array([len(part) for part in parts])
+    if sizes.sum() < min_size * len(parts):
+        raise ValueError(f"Cannot give {min_size} sample(s) to each of {len(parts)} users "
+                f"from {sizes.sum()} samples")
+    parts = list(parts)
+    for i in np.flatnonzero(sizes < min_size):
+        while sizes[i] < min_size:
+            largest = int(np.argmax(sizes))
+            count = min(min_size - sizes[i], sizes[largest] - min_size)
+            moved = np.zeros(sizes[largest], dtype=bool)
+            moved[rng.choice(sizes[largest], count, replace=False)] = True
+            parts[i] = np.concatenate((parts[i], parts[largest][moved]))
+            parts[largest] = parts[largest][~moved]
+            sizes[i] += count
+            sizes[largest] -= count
+    return parts
@@ -1,23 +1,126 @@
 import numpy as np # used for handling numbers
-import pandas as pd # used for handling the dataset
 from sklearn.impute import SimpleImputer # used for handling missing data
 from sklearn.preprocessing import LabelEncoder, OneHotEncoder # used for encoding categorical data
 from sklearn.model_selection import train_test_split # used for splitting training and testing data
 from sklearn.preprocessing import StandardScaler # used for feature scaling
 from sklearn.compose import ColumnTransformer 
 
+import os
+import json
+import hashlib
+
+from log import log
+from util import atomic_write
+
+# Bump this when the preprocessing output changes to invalidate old caches
+CACHE_VERSION = 2
+CACHE_ARRAYS = ["X_train", "X_test", "Y_train", "Y_test"]
+
+
+def file_hash(filename):
+    """
+    SHA-256 of the file contents, read in blocks.
+    """
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
 class DataPreprocessor:
     """
     Preprocess data, apply one-hot encoding to categorical data etc.
     """
-    def __init__(self, test_size=0.2):
+    def __init__(self, test_size=0.2, random_state=0, dtype=np.float64, cache_dir=None, chunk_size=0):
+        """
+        If cache_dir is given, preprocessed arrays are cached there and reused as long as
+        the CSV contents and the preprocessing parameters are the same.
+        If chunk_size is positive, the CSV is streamed in chunks of that many rows and
+        written to the cache incrementally, see stream_load.
+        """
         self.test_size = test_size
+        self.random_state = random_state
+        self.dtype = np.dtype(dtype)
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+
+    def cache_path(self, filename):
+        """
+        Directory of the cache entry for the given CSV file and the current parameters.
+        """
+        key = json.dumps({
+            "version": CACHE_VERSION,
+            "csv": file_hash(filename),
+            "test_size": self.test_size,
+            "random_state": self.random_state,
+            "dtype": self.dtype.str,
+            # Streaming ingestion splits the data differently
+            "streaming": self.chunk_size > 0,
+            })
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest())
+
+    def load_cache(self, path):
+        """
+        Load the arrays from the given cache entry with memory mapping.
+        Pages are copy-on-write, so that processes can share them as long as they don't write.
+        Returns None if the entry doesn't exist.
+        """
+        if not os.path.isdir(path):
+            return None
+        with open(os.path.join(path, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        self.categorical_features = meta["categorical_features"]
+        self.categories = [np.array(c, dtype=object) for c in meta["categories"]]
+        # Encoders are not refit, only the label classes are needed
+        self.column_transformer = None
+        self.y_transformer = LabelEncoder()
+        self.y_transformer.classes_ = np.array(meta["classes"], dtype=object)
+        return tuple(np.load(os.path.join(path, name + ".npy"), mmap_mode='c') for name in CACHE_ARRAYS)
+
+    def write_meta(self, directory):
+        """
+        Write the encoder metadata to the given cache entry directory.
+        """
+        with open(os.path.join(directory, "meta.json"), 'w') as f:
+            json.dump({
+                "categorical_features": self.categorical_features,
+                "categories": [c.tolist() for c in self.categories],
+                "classes": self.y_transformer.classes_.tolist(),
+                }, f)
+
+    def save_cache(self, path, arrays):
+        """
+        Save the arrays and the encoder metadata to the given cache entry.
+        """
+        # The entry is written to a temporary directory, so that a partial entry is never
+        # visible to other processes
+        with atomic_write(path, directory=True) as tmp:
+            for name, arr in zip(CACHE_ARRAYS, arrays):
+                np.save(os.path.join(tmp, name + ".npy"), arr)
+            self.write_meta(tmp)
 
     def fit_load(self, filename):
         """
         1. Load the given CSV from filename.
         2. Create and fit the encoders/transformers to it.
+        If the cache is enabled and contains this dataset, steps above are skipped.
         """
+        if self.cache_dir:
+            path = self.cache_path(filename)
+            cached = self.load_cache(path)
+            if cached is not None:
+                log.info(f"Loaded preprocessed dataset from cache: {path}")
+                return cached
+
+        if self.chunk_size > 0:
+            if not self.cache_dir:
+                raise ValueError("Streaming ingestion requires a cache directory")
+            log.info(f"Streaming dataset in chunks of {self.chunk_size} rows")
+            self.stream_load(filename, path)
+            return self.load_cache(path)
+
+        # Imported here, so that cached runs don't need to load pandas at all
+        import pandas as pd # used for handling the dataset
         dataset = pd.read_csv(filename)
         # Splitting the attributes into independent and dependent attributes
         X = dataset.iloc[:, :-1].values # attributes to determine dependent variable / Class
@@ -27,12 +130,13 @@ class DataPreprocessor:
         self.categorical_features = [i for i, e in enumerate(X[0]) if isinstance(e, str)]
         self.column_transformer = ColumnTransformer([("categorical", OneHotEncoder(), self.categorical_features)], remainder="passthrough")
         X = self.column_transformer.fit_transform(X)
+        self.categories = self.column_transformer.named_transformers_["categorical"].categories_
 
         # Handle categorical class data
         self.y_transformer = LabelEncoder()
         Y = self.y_transformer.fit_transform(Y)
 
-        X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=self.test_size, random_state=0)
+        X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=self.test_size, random_state=self.random_state)
 
         # NOTE: Scaling is not done here
         # In federated learning, participants don't know the data of other users
@@ -40,5 +144,138 @@ class DataPreprocessor:
         X_train = self.x_scaler.fit_transform(X_train)
         X_test = self.x_scaler.transform(X_test)
 
+        X_train = np.asarray(X_train, dtype=self.dtype)
+        X_test = np.asarray(X_test, dtype=self.dtype)
+        if self.cache_dir:
+            self.save_cache(path, (X_train, X_test, Y_train, Y_test))
+
         return X_train, X_test, Y_train, Y_test
 
+    def stream_load(self, filename, path, max_categories=10000):
+        """
+        Preprocess the given CSV in chunks and write the result to the cache entry at path.
+        Peak memory is bounded by the chunk size instead of the dataset size.
+
+        1. First pass reads every column as text, counts the rows, finds the categorical
+           columns (any non-numeric value in any row) and learns their vocabularies.
+        2. Second pass reads with explicit dtypes, one-hot encodes the categorical columns
+           and appends each row to the train or test array on disk.
+
+        Output has the same column layout and label encoding as fit_load: one-hot columns
+        first, then the remaining columns in order. Missing categorical values are all zeros.
+        Each row is put into the test set with probability test_size, using a random stream
+        that only depends on random_state and the chunk.
+        Vocabulary of a column is dropped once it exceeds max_categories unique values,
+        such a column must be numeric.
+        """
+        import pandas as pd
+
+        # Pass 1: vocabularies and row counts
+        columns = None
+        vocabularies = None
+        categorical = None
+        classes = set()
+        num_train = 0
+        num_test = 0
+        for i, chunk in enumerate(pd.read_csv(filename, chunksize=self.chunk_size, dtype=str)):
+            if columns is None:
+                columns = list(chunk.columns[:-1])
+                vocabularies = [set() for _ in columns]
+                categorical = [False] * len(columns)
+            for j, column in enumerate(columns):
+                values = chunk[column].dropna()
+                if not categorical[j] and pd.to_numeric(values, errors="coerce").isna().any():
+                    if vocabularies[j] is None:
+                        raise ValueError(f"Column {column} has more than {max_categories} distinct values before its first non-numeric value")
+                    categorical[j] = True
+                if vocabularies[j] is not None:
+                    vocabularies[j].update(values.unique())
+                    if not categorical[j] and len(vocabularies[j]) > max_categories:
+                        vocabularies[j] = None
+            classes.update(chunk.iloc[:, -1].dropna().unique())
+            is_test = self.test_mask(i, len(chunk))
+            num_test += int(is_test.sum())
+            num_train += len(chunk) - int(is_test.sum())
+
+        self.categorical_features = [j for j, c in enumerate(categorical) if c]
+        self.categories = [np.array(sorted(vocabularies[j]), dtype=object) for j in self.categorical_features]
+        numeric_features = [j for j, c in enumerate(categorical) if not c]
+        self.y_transformer = LabelEncoder()
+        self.y_transformer.classes_ = self.sorted_classes(classes)
+        self.column_transformer = None
+        num_features = sum(len(c) for c in self.categories) + len(numeric_features)
+
+        # Pass 2: encode and write
+        with atomic_write(path, directory=True) as tmp:
+            open_memmap = np.lib.format.open_memmap
+            X_train = open_memmap(os.path.join(tmp, "X_train.npy"), mode='w+', dtype=self.dtype, shape=(num_train, num_features))
+            X_test = open_memmap(os.path.join(tmp, "X_test.npy"), mode='w+', dtype=self.dtype, shape=(num_test, num_features))
+            Y_train = open_memmap(os.path.join(tmp, "Y_train.npy"), mode='w+', dtype=np.int64, shape=(num_train,))
+            Y_test = open_memmap(os.path.join(tmp, "Y_test.npy"), mode='w+', dtype=np.int64, shape=(num_test,))
+
+            label = "__label__"
+            dtypes = {label: str}
+            dtypes.update({columns[j]: str for j in self.categorical_features})
+            dtypes.update({columns[j]: self.dtype for j in numeric_features})
+            train_offset = 0
+            test_offset = 0
+            reader = pd.read_csv(filename, chunksize=self.chunk_size, dtype=dtypes,
+                    names=columns + [label], header=0)
+            for i, chunk in enumerate(reader):
+                X = np.zeros((len(chunk), num_features), dtype=self.dtype)
+                offset = 0
+                for j, categories in zip(self.categorical_features, self.categories):
+                    codes = pd.Categorical(chunk[columns[j]], categories=categories).codes
+                    # Missing values have code -1 and no one-hot column
+                    rows = np.flatnonzero(codes >= 0)
+                    X[rows, offset + codes[rows]] = 1
+                    offset += len(categories)
+                X[:, offset:] = chunk[[columns[j] for j in numeric_features]].to_numpy(dtype=self.dtype)
+                Y = self.encode_labels(chunk[label]).astype(np.int64)
+                if (Y < 0).any():
+                    raise ValueError(f"Missing label in chunk {i} of {filename}")
+
+                is_test = self.test_mask(i, len(chunk))
+                n_test = int(is_test.sum())
+                n_train = len(chunk) - n_test
+                X_train[train_offset:train_offset+n_train] = X[~is_test]
+                Y_train[train_offset:train_offset+n_train] = Y[~is_test]
+                X_test[test_offset:test_offset+n_test] = X[is_test]
+                Y_test[test_offset:test_offset+n_test] = Y[is_test]
+                train_offset += n_train
+                test_offset += n_test
+
+            for arr in (X_train, X_test, Y_train, Y_test):
+                arr.flush()
+            del X_train, X_test, Y_train, Y_test
+            self.write_meta(tmp)
+
+    @staticmethod
+    def sorted_classes(classes):
+        """
+        Label classes from their text in the CSV, in the same order as fit_load.
+        Pandas reads labels that are all numbers as numbers, which LabelEncoder sorts by value.
+        """
+        import pandas as pd
+        values = pd.to_numeric(pd.Series(sorted(classes), dtype=object), errors="coerce")
+        if len(values) > 0 and not values.isna().any():
+            return np.unique(values.to_numpy())
+        return np.array(sorted(classes), dtype=object)
+
+    def encode_labels(self, labels):
+        """
+        Codes of the labels read as text, -1 for missing labels.
+        """
+        import pandas as pd
+        classes = self.y_transformer.classes_
+        if classes.dtype != object:
+            labels = pd.to_numeric(labels)
+        return pd.Categorical(labels, categories=classes).codes
+
+    def test_mask(self, chunk_index, size):
+        """
+        Random train/test assignment of the rows in the given chunk.
+        Same for both passes of stream_load.
+        """
+        rng = np.random.default_rng([self.random_state, chunk_index])
+        return rng.random(size) < self.test_size
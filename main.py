@@ -1,11 +1,16 @@
-from torch.utils.data import DataLoader
 from torch import nn
 import torch.nn.functional as F
 
 from Agents import FL
 from config import *
 from util import timefunc
-from dataset import load_dataset, split_data_equal
+from dataset import load_dataset, split_data
+from ClientPool import ClientPool
+from BatchedClients import BatchedClients
+from AsyncTraining import AsyncTraining
+from Evaluator import Evaluator
+from profiler import profiler
+from costs import costs
 import ModelConfig
 
 import sys
@@ -26,38 +31,21 @@ def fractionUsers(users, fraction: float):
     return users[:amount]
 
 
-def test_model(model, dataloader, means, stds):
-    """
-    Test the accuracy and loss of the model with given data loader.
-    Mean and std values are used for data standardization.
-    """
-    model.eval()
-    # testing
-    test_loss = 0
-    correct = 0
-    for idx, (X, y) in enumerate(dataloader):
-        sX = (X - means) / stds
-        prediction = model(sX)
-        # sum up batch loss
-        test_loss += F.cross_entropy(prediction, y, reduction='sum').item()
-        # get the index of the max log-probability
-        y_pred = prediction.data.max(1, keepdim=True)[1]
-        correct += y_pred.eq(y.data.view_as(y_pred)).long().cpu().sum()
-
-    test_loss /= len(dataloader.dataset)
-    accuracy = correct / len(dataloader.dataset)
-    
-    return accuracy.item(), test_loss
-
-
-
 @timefunc(log.info)
 def main():
     global NUM_USERS, LossFunc
-    global train_dataloaders, test_dataloader
+    global train_data
 
     def preprocessStage(subset):
         log.info(f"Starting preprocess stage... {len(subset)} client(s) participate.")
+        if PREPROCESSING_ROUNDS == 1:
+            receipts = [client.localStats() for client in subset]
+            server.combineStats(receipts)
+            for client in clients:
+                client.getMeans()
+                client.getStds()
+            return
+
         receipts = [client.localMeans() for client in subset]
         server.combineMeans(receipts)
         # Even though a subset participates in preprocessing,
@@ -86,13 +74,12 @@ def main():
 
     log.info(f"Loading dataset: {DATASET_FILENAME}")
 
-    dataset = load_dataset(DATASET_FILENAME, VALIDATION_SIZE)
+    dataset = load_dataset(DATASET_FILENAME, VALIDATION_SIZE, DATASET_CACHE, CHUNK_SIZE)
     log.info(f"Training samples: {dataset.num_train_data}")
     log.info(f"Features: {dataset.num_features}")
     log.info(f"Labels: {dataset.num_labels}")
 
-    test_dataloader = DataLoader(dataset.test, batch_size=TEST_BATCH_SIZE)
-    train_dataloaders = split_data_equal(dataset.train, NUM_USERS, BATCH_SIZE)
+    train_data = split_data(dataset.train, NUM_USERS, BATCH_SIZE, PARTITION, PARTITION_ALPHA)
 
     try:
         model = ModelConfig.__dict__[MODEL_NAME]
@@ -103,6 +90,9 @@ def main():
     global_model = model(dataset.num_features, dataset.num_labels, MODEL_ARGS)
     global_model.to(INTERNAL_DTYPE.torch)
     local_model = copy.deepcopy(global_model)
+    if FLAT_PARAMETERS:
+        global_model.flatten()
+        local_model.flatten()
     log.info(f"Byte size of the model: {len(local_model.to_bytes())}")
     # Global loss function
     FL.LossFunc = nn.CrossEntropyLoss()
@@ -113,9 +103,16 @@ def main():
     # First NUM_USERS accounts are clients.
     # Note that server is also a client when NUM_USERS == len(accounts)
     clients = [
-            FL.Client(accounts[i], local_model, dataloader)
-            for i, dataloader in enumerate(train_dataloaders)
+            FL.Client(accounts[i], local_model, data)
+            for i, data in enumerate(train_data)
             ]
+    edges = []
+    if EDGE_GROUP_SIZE > 0:
+        edges = [
+                FL.EdgeAggregator(accounts[i], local_model, clients[i:i+EDGE_GROUP_SIZE])
+                for i in range(0, len(clients), EDGE_GROUP_SIZE)
+                ]
+        log.info(f"Aggregating the updates of {len(edges)} group(s) of up to {EDGE_GROUP_SIZE} client(s) at the edge")
 
     if PREPROCESSING_FRACTION == 0.0:
         log.info(f"Fraction is 0; skipping preprocessing stage")
@@ -125,34 +122,84 @@ def main():
             client.getStds()
     else:
         preprocessStage(fractionUsers(clients, PREPROCESSING_FRACTION))
+    # Setup and preprocessing are the first profiler and cost record
+    profiler.endRound()
+    costs.endRound()
     means = clients[0].means
     stds = clients[0].stds
+    # Standardize the test set only once, global statistics are fixed from now on
+    test_X, test_y = dataset.test.tensors
+    evaluator = Evaluator((test_X - means) / stds, test_y, TEST_BATCH_SIZE, BACKGROUND_EVALUATION)
 
-    # Both on validation set
-    accuracies = []
-    losses = []
-
-    log.info("Starting training...")
-    for i in tqdm(range(GLOBAL_EPOCHS)):
-        subset = fractionUsers(clients, TRAINING_FRACTION)
-        receipts = [client.localUpdate() for client in tqdm(subset)]
-        server.averageUpdates(receipts)
-        if EVAL_PER_EPOCH:
-            model = server.getModel()
-            acc, loss = test_model(model, test_dataloader, means, stds)
-            accuracies.append(acc)
-            losses.append(loss)
-            log.info(f"Accuracy on validation: {acc * 100.0:.4f}%")
-
+    pool = None
+    batched = None
+    scheduler = None
+    try:
+        if ASYNC_TRAINING:
+            log.info(f"Training asynchronously with a buffer of {BUFFER_SIZE} update(s)")
+            scheduler = AsyncTraining(server, clients)
+        elif BATCHED_CLIENTS:
+            log.info("Training clients as a single batch")
+            batched = BatchedClients(local_model)
+        elif WORKERS > 0:
+            log.info(f"Training clients in parallel with {WORKERS} worker(s)")
+            pool = ClientPool(WORKERS, local_model, train_data, means, stds)
+
+        log.info("Starting training...")
+        for i in tqdm(range(GLOBAL_EPOCHS)):
+            if scheduler is not None:
+                scheduler.step()
+            else:
+                subset = fractionUsers(clients, TRAINING_FRACTION)
+                if batched is not None:
+                    receipts = batched.localUpdates(subset)
+                elif pool is not None:
+                    receipts = pool.localUpdates(subset)
+                else:
+                    receipts = [client.localUpdate() for client in tqdm(subset)]
+                if edges:
+                    # Clients of the groups sent their updates to the edge aggregators
+                    receipts = [receipt for receipt in receipts if receipt is not None]
+                    for edge in edges:
+                        receipt = edge.commitUpdates()
+                        if receipt is not None:
+                            receipts.append(receipt)
+                server.averageUpdates(receipts)
+            # The last round is always evaluated
+            if EVAL_PER_EPOCH and ((i + 1) % EVALUATE_EVERY == 0 or i == GLOBAL_EPOCHS - 1):
+                model = server.getModel()
+                with profiler.timer("evaluate"):
+                    result = evaluator.submit(i, model)
+                if result is not None:
+                    log.info(f"Accuracy on validation: {result[0] * 100.0:.4f}%")
+            profiler.endRound()
+            costs.endRound()
+    finally:
+        # Workers and the evaluation thread must not outlive a failed run,
+        # submitted evaluations can still be read after shutdown
+        if pool is not None:
+            pool.shutdown()
+        evaluator.shutdown()
+
+    results = {"name": datetime.now().isoformat()}
     if EVAL_PER_EPOCH:
-        add_results({
-                "name": datetime.now().isoformat(),
-                "accuracies": accuracies,
-                "losses": losses,
-            })
-    else:
+        evaluated = evaluator.results()
+        if BACKGROUND_EVALUATION:
+            for epoch, acc, loss in evaluated:
+                log.info(f"Accuracy on validation after epoch {epoch}: {acc * 100.0:.4f}%")
+        # Global epochs of the accuracies and losses, not every epoch is evaluated
+        results["epochs"] = [epoch for epoch, acc, loss in evaluated]
+        results["accuracies"] = [acc for epoch, acc, loss in evaluated]
+        results["losses"] = [loss for epoch, acc, loss in evaluated]
+    roundCosts = costs.results()
+    results["costs"] = {"setup": roundCosts[0], "rounds": roundCosts[1:]}
+    profile = profiler.results()
+    if profile is not None:
+        results["profile"] = {"setup": profile[0], "rounds": profile[1:]}
+    add_results(results)
+    if not EVAL_PER_EPOCH:
         model = server.getModel()
-        acc, loss = test_model(model, test_dataloader, means, stds)
+        acc, loss = evaluator.evaluate(model)
         log.info(f"Accuracy on validation: {acc * 100.0:.4f}%")
 
 
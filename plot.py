@@ -5,8 +5,10 @@ if __name__ == '__main__':
     data = read_results()
 
     for datum in data:
+        if "losses" not in datum:
+            continue
         field = datum["losses"]
-        plt.plot(range(len(field)), field, label=datum["name"])
+        plt.plot(datum.get("epochs", range(len(field))), field, label=datum["name"])
     plt.xlabel("Rounds (Global Epoch)")
     plt.ylabel("Loss")
     plt.title("Validation Loss vs. Global Epoch")
@@ -14,10 +16,59 @@ if __name__ == '__main__':
     plt.show()
 
     for datum in data:
+        if "accuracies" not in datum:
+            continue
         field = datum["accuracies"]
-        plt.plot(range(len(field)), field, label=datum["name"])
+        plt.plot(datum.get("epochs", range(len(field))), field, label=datum["name"])
     plt.xlabel("Rounds (Global Epoch)")
     plt.ylabel("Accuracy")
     plt.title("Validation Accuracy vs. Global Epoch")
     plt.legend()
     plt.show()
+
+    # Cost vs. accuracy, cost is cumulative gas, or bytes posted on platforms without gas
+    costed = [datum for datum in data if "costs" in datum and "accuracies" in datum]
+    useGas = any(record["total"].get("gas", 0) > 0
+            for datum in costed for record in datum["costs"]["rounds"])
+    for datum in costed:
+        cost = 0
+        field = []
+        for record in datum["costs"]["rounds"]:
+            total = record["total"]
+            if useGas:
+                cost += total.get("gas", 0)
+            else:
+                cost += sum(value for name, value in total.items() if name.endswith("_bytes"))
+            field.append(cost)
+        epochs = datum.get("epochs", range(len(datum["accuracies"])))
+        plt.plot([field[epoch] for epoch in epochs], datum["accuracies"], label=datum["name"])
+    if costed:
+        plt.xlabel("Cumulative Gas" if useGas else "Cumulative Bytes Posted")
+        plt.ylabel("Accuracy")
+        plt.title("Validation Accuracy vs. Cost")
+        plt.legend()
+        plt.show()
+
+    # Time per phase of the latest profiled run, next to its accuracy
+    profiled = [datum for datum in data if "profile" in datum]
+    if profiled:
+        datum = profiled[-1]
+        rounds = datum["profile"]["rounds"]
+        fig, (timeAxis, accAxis) = plt.subplots(1, 2, figsize=(12, 5))
+        # Phases may be nested, e.g. commit includes transact, so they are not stacked
+        phases = sorted({phase for record in rounds for phase in record["times"]})
+        for phase in phases:
+            field = [record["times"].get(phase, 0.0) for record in rounds]
+            timeAxis.plot(range(len(field)), field, label=phase)
+        timeAxis.set_xlabel("Rounds (Global Epoch)")
+        timeAxis.set_ylabel("Time (s)")
+        timeAxis.set_title("Time per Phase vs. Global Epoch")
+        timeAxis.legend()
+        if "accuracies" in datum:
+            field = datum["accuracies"]
+            accAxis.plot(datum.get("epochs", range(len(field))), field)
+        accAxis.set_xlabel("Rounds (Global Epoch)")
+        accAxis.set_ylabel("Accuracy")
+        accAxis.set_title("Validation Accuracy vs. Global Epoch")
+        fig.suptitle(datum["name"])
+        plt.show()
@@ -0,0 +1,88 @@
+"""
+Lightweight instrumentation of the phases of a federated learning round.
+Named timers are aggregated per round, and also per client.
+When profiling is off, the global profiler is a NullProfiler whose timers are a shared
+no-op context manager, so instrumented code pays only a method call.
+"""
+from collections import defaultdict
+from contextlib import nullcontext
+from time import perf_counter
+
+from config import PROFILE
+
+
+class Timer:
+    """
+    Context manager that adds the elapsed time to a named timer of the profiler.
+    """
+    __slots__ = ("profiler", "name", "client", "start")
+
+    def __init__(self, profiler, name, client):
+        self.profiler = profiler
+        self.name = name
+        self.client = client
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, perf_counter() - self.start, self.client)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.rounds = []
+        self.reset()
+
+    def reset(self):
+        self.times = defaultdict(float)
+        self.clients = defaultdict(lambda: defaultdict(float))
+
+    def timer(self, name, client=None):
+        """
+        Time a phase, optionally attributed to the client with given index.
+        """
+        return Timer(self, name, client)
+
+    def add(self, name, seconds, client=None):
+        self.times[name] += seconds
+        if client is not None:
+            self.clients[client][name] += seconds
+
+    def endRound(self):
+        """
+        Close the current round, phases after this are counted in the next one.
+        """
+        self.rounds.append({
+            "times": dict(self.times),
+            "clients": {str(client): dict(times) for client, times in self.clients.items()},
+            })
+        self.reset()
+
+    def results(self):
+        """
+        Per-round records, the phases before the first round (e.g. preprocessing) are
+        the first record.
+        """
+        return self.rounds
+
+
+class NullProfiler:
+    timerContext = nullcontext()
+
+    def timer(self, name, client=None):
+        return NullProfiler.timerContext
+
+    def add(self, name, seconds, client=None):
+        pass
+
+    def endRound(self):
+        pass
+
+    def results(self):
+        return None
+
+
+profiler = Profiler() if PROFILE else NullProfiler()
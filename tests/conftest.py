@@ -0,0 +1,10 @@
+"""
+Modules read config.ini at import time, from the first command line argument,
+which would otherwise be an argument of pytest.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.argv = [sys.argv[0], os.path.join(ROOT, "config.ini")]
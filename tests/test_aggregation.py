@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from Aggregation import aggregate_batch, aggregate_stream
+
+
+@pytest.mark.parametrize("dtype", [np.float16, np.float32, np.float64])
+def test_stream_matches_batch(dtype):
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(1, 1000, 7)
+    updates = rng.normal(0, 10, (7, 100)).astype(dtype)
+    events = [(int(size), update.tobytes()) for size, update in zip(sizes, updates)]
+    total = int(sizes.sum())
+    batch = aggregate_batch(events, total, dtype)
+    stream = aggregate_stream(events, total, dtype)
+    assert stream.dtype == np.float64
+    np.testing.assert_allclose(stream, batch, rtol=1e-12, atol=1e-12)
+
+
+def test_no_updates():
+    assert aggregate_batch([], 1) is None
+    assert aggregate_stream([], 1) is None
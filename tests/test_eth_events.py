@@ -0,0 +1,67 @@
+"""
+Paged log queries of EthPlatform, with the event logs of a contract held in memory.
+"""
+from types import SimpleNamespace
+
+import pytest
+from web3.datastructures import AttributeDict
+
+import EthPlatform as platform
+from EthPlatform import EthPlatform, makeManifest
+
+
+class Event:
+    """
+    Event logs of a single type, filtered like eth_getLogs. Records the queried block ranges.
+    """
+    def __init__(self, logs):
+        self.logs = logs
+        self.queries = []
+
+    def getLogs(self, fromBlock, toBlock, argument_filters):
+        self.queries.append((fromBlock, toBlock))
+        return [event for event in self.logs
+                if fromBlock <= event.blockNumber <= toBlock
+                and all(event["args"][name] == value for name, value in argument_filters.items())]
+
+
+def makeLog(block, **args):
+    return AttributeDict({"blockNumber": block, "args": AttributeDict(args)})
+
+
+@pytest.fixture
+def account(monkeypatch):
+    monkeypatch.setattr(platform, "LOG_PAGE_BLOCKS", 4)
+    monkeypatch.setattr(EthPlatform, "w3", SimpleNamespace(eth=SimpleNamespace(block_number=20)))
+    monkeypatch.setattr(EthPlatform, "blobStore", None)
+    account = EthPlatform.Account("0xserver")
+    account.epochBlock = 3
+    account.getEpoch = lambda: 1
+    return account
+
+
+def test_update_events_are_queried_in_pages(account):
+    model = b"chunked model"
+    updates = Event([
+            makeLog(2, **{"from": "0xa", "epoch": 1, "size": 1, "model": b"before the epoch block"}),
+            makeLog(5, **{"from": "0xa", "epoch": 0, "size": 1, "model": b"stale"}),
+            makeLog(5, **{"from": "0xa", "epoch": 1, "size": 2, "model": b"a"}),
+            makeLog(9, **{"from": "0xb", "epoch": 1, "size": 3, "model": makeManifest(2, model)}),
+            makeLog(12, **{"from": "0xa", "epoch": 1, "size": 4, "model": b"repeated"}),
+            makeLog(20, **{"from": "0xc", "epoch": 1, "size": 5, "model": b"c"}),
+            ])
+    chunks = Event([
+            makeLog(6, **{"from": "0xb", "epoch": 1, "index": 1, "data": model[7:]}),
+            makeLog(7, **{"from": "0xb", "epoch": 1, "index": 0, "data": model[:7]}),
+            makeLog(8, **{"from": "0xc", "epoch": 1, "index": 0, "data": b"other sender"}),
+            ])
+    account.contract = SimpleNamespace(events=SimpleNamespace(LocalUpdate=updates, LocalUpdateChunk=chunks))
+
+    events = account.getUpdateEvents()
+    assert next(events) == (2, b"a")
+    # Only the first page has been queried before the first update is processed
+    assert updates.queries == [(3, 6)]
+    assert list(events) == [(3, model), (5, b"c")]
+    assert updates.queries == [(3, 6), (7, 10), (11, 14), (15, 18), (19, 20)]
+    # Chunks of the manifest are searched up to its block only
+    assert chunks.queries == [(3, 6), (7, 9)]
@@ -0,0 +1,113 @@
+"""
+Transactions of EthPlatform on eth-tester with manual mining. Contracts are not needed:
+the transactions are plain transfers with calldata, sent through the same Account methods.
+"""
+from collections import Counter, defaultdict
+
+import pytest
+
+import EthPlatform as platform
+from EthPlatform import EthPlatform
+from costs import CostTracker
+
+
+class Transfer:
+    """
+    Sends calldata to an address, in place of a contract function.
+    """
+    def __init__(self, to, data=b""):
+        self.to = to
+        self.data = data
+
+    def estimateGas(self, transaction):
+        return EthPlatform.w3.eth.estimate_gas({**transaction, "to": self.to, "data": self.data})
+
+    def transact(self, transaction):
+        return EthPlatform.w3.eth.send_transaction({**transaction, "to": self.to, "data": self.data})
+
+
+@pytest.fixture
+def accounts(monkeypatch):
+    monkeypatch.setattr(platform, "AUTO_MINE", False)
+    monkeypatch.setattr(platform, "MINING_BATCH_SIZE", 3)
+    monkeypatch.setattr(platform, "ASYNC_TRANSACTIONS", True)
+    monkeypatch.setattr(platform, "READ_CACHE", False)
+    monkeypatch.setattr(EthPlatform, "pendingSenders", set())
+    monkeypatch.setattr(EthPlatform, "pendingGas", 0)
+    monkeypatch.setattr(platform, "costs", CostTracker())
+    return EthPlatform.initAccounts(10)
+
+
+def senders_by_block(receipts):
+    blocks = defaultdict(list)
+    for receipt in receipts:
+        assert receipt.status == 1
+        blocks[receipt.blockNumber].append(receipt["from"])
+    return [blocks[number] for number in sorted(blocks)]
+
+
+def test_manual_mining_batches_transactions(accounts):
+    w3 = EthPlatform.w3
+    server = accounts[-1]
+    start = w3.eth.block_number
+    pending = [account.submit(Transfer(server.account, bytes(1024))) for account in accounts[:9]]
+    # Full batches are mined when the next sender arrives, the last one stays pending
+    assert w3.eth.block_number - start == 2
+    receipts = server.waitReceipts(pending)
+    assert [len(senders) for senders in senders_by_block(receipts)] == [3, 3, 3]
+
+    # A sender can't have two pending transactions in the same block
+    pending = [accounts[0].submit(Transfer(server.account)),
+            accounts[1].submit(Transfer(server.account)),
+            accounts[0].submit(Transfer(server.account))]
+    blocks = senders_by_block(server.waitReceipts(pending))
+    assert [len(senders) for senders in blocks] == [2, 1]
+
+    # Synchronous transactions are mined by wait
+    receipt = server.wait(server.send(Transfer(accounts[0].account)))
+    assert receipt.blockNumber == w3.eth.block_number
+    for number in range(start + 1, w3.eth.block_number + 1):
+        senders = [tx["from"] for tx in w3.eth.get_block(number, True).transactions]
+        assert len(senders) == len(set(senders)) <= 3
+
+
+def test_costs_match_receipts(accounts):
+    server = accounts[-1]
+    pending = [account.submit(Transfer(server.account, bytes(100 * i))) for i, account in enumerate(accounts[:5])]
+    receipts = server.waitReceipts(pending)
+    # Receipts that were already waited are not counted again
+    server.waitReceipts(receipts)
+    receipts.append(server.wait(server.send(Transfer(accounts[0].account, b"\x01" * 40))))
+    platform.costs.endRound()
+
+    gas = Counter()
+    transactions = Counter()
+    for receipt in receipts:
+        gas[receipt["from"]] += receipt.gasUsed
+        transactions[receipt["from"]] += 1
+    recorded = platform.costs.results()[-1]
+    for address in transactions:
+        assert recorded["accounts"][address]["gas"] == gas[address]
+        assert recorded["accounts"][address]["transactions"] == transactions[address]
+    assert recorded["total"] == {"gas": sum(gas.values()), "transactions": len(receipts)}
+
+
+class Rejected(Transfer):
+    """
+    A transfer that the node rejects when it's sent.
+    """
+    def transact(self, transaction):
+        raise ValueError("rejected")
+
+
+def test_rejected_transactions_are_not_counted(accounts):
+    client, server = accounts[0], accounts[-1]
+    with pytest.raises(ValueError):
+        client.send(Rejected(server.account))
+    # The nonce of the rejected transaction is reused
+    receipt = server.wait(client.send(Transfer(server.account)))
+    assert receipt.status == 1
+    platform.costs.endRound()
+    recorded = platform.costs.results()[-1]
+    assert recorded["accounts"][str(client.account)]["transactions"] == 1
+    assert recorded["total"]["transactions"] == 1
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import TensorDataset
+
+from dataset import split_data
+from dataset.partition import partition_dirichlet, partition_quantity, ensure_min_size
+
+
+def assert_partition(parts, n):
+    indices = np.concatenate(parts)
+    assert len(indices) == n
+    assert len(np.unique(indices)) == n
+
+
+def test_skewed_partitions_have_no_empty_parts():
+    rng = np.random.RandomState(0)
+    labels = rng.randint(0, 10, 1000)
+    parts = partition_dirichlet(labels, 30, 0.05, rng)
+    assert min(len(part) for part in parts) == 0
+    parts = ensure_min_size(parts, 5, rng)
+    assert min(len(part) for part in parts) >= 5
+    assert_partition(parts, 1000)
+
+    parts = ensure_min_size(partition_quantity(1000, 30, 0.05, rng), 1, rng)
+    assert min(len(part) for part in parts) >= 1
+    assert_partition(parts, 1000)
+
+
+def test_ensure_min_size_keeps_large_parts():
+    parts = [np.arange(0, 10), np.arange(10, 12), np.array([], dtype=int)]
+    parts = ensure_min_size(parts, 2)
+    assert [len(part) for part in parts] == [8, 2, 2]
+    assert_partition(parts, 12)
+
+
+def test_ensure_min_size_too_few_samples():
+    with pytest.raises(ValueError):
+        ensure_min_size([np.arange(3), np.array([], dtype=int)], 2)
+
+
+def test_split_data_dirichlet_clients_can_train():
+    np.random.seed(0)
+    X = torch.randn(600, 4)
+    y = torch.tensor(np.random.randint(0, 10, 600))
+    clients = split_data(TensorDataset(X, y), 30, 16, "dirichlet", 0.05)
+    assert len(clients) == 30
+    assert all(client.size >= 1 and len(client) >= 1 for client in clients)
+    assert sum(client.size for client in clients) == 600
+
+    with pytest.raises(ValueError):
+        split_data(TensorDataset(X[:20], y[:20]), 30, 16, "iid")
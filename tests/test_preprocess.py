@@ -0,0 +1,44 @@
+import numpy as np
+
+from dataset.preprocess import DataPreprocessor
+
+
+CSV = """size,color,shape,label
+1.5,x,round,2
+2.0,y,square,10
+0.5,x,round,1
+3.0,z,square,10
+1.0,y,round,2
+4.5,x,square,1
+2.5,z,round,10
+"""
+
+
+def load(path, cache_dir, chunk_size):
+    preprocessor = DataPreprocessor(test_size=0.3, cache_dir=cache_dir, chunk_size=chunk_size)
+    X_train, X_test, Y_train, Y_test = preprocessor.fit_load(path)
+    X = np.concatenate((X_train, X_test))
+    Y = np.concatenate((Y_train, Y_test))
+    # Train and test splits differ, rows are compared in the order of the size column
+    order = np.argsort(X[:, -1])
+    return X[order], Y[order], preprocessor.y_transformer.classes_
+
+
+def test_stream_load_matches_fit_load(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text(CSV)
+    X, Y, classes = load(path, None, 0)
+    X_stream, Y_stream, classes_stream = load(path, str(tmp_path / "cache"), 3)
+    np.testing.assert_array_equal(X_stream, X)
+    np.testing.assert_array_equal(Y_stream, Y)
+    assert list(classes_stream) == list(classes) == [1, 2, 10]
+
+
+def test_stream_load_missing_category(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b,label\nx,p,0\ny,q,1\nx,,0\nx,q,1\n")
+    preprocessor = DataPreprocessor(test_size=0.0, cache_dir=str(tmp_path / "cache"), chunk_size=2)
+    X_train, X_test, Y_train, Y_test = preprocessor.fit_load(path)
+    # Columns are a=x, a=y, b=p, b=q
+    np.testing.assert_array_equal(X_train[2], [1, 0, 0, 0])
+    np.testing.assert_array_equal(X_train.sum(axis=1), [2, 2, 1, 2])
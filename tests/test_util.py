@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from util import atomic_write
+
+
+def test_atomic_write_file(tmp_path):
+    path = str(tmp_path / "sub" / "file")
+    with atomic_write(path) as f:
+        f.write(b'first')
+    with atomic_write(path, 'w') as f:
+        f.write('second')
+    with open(path) as f:
+        assert f.read() == 'second'
+    assert os.listdir(tmp_path / "sub") == ["file"]
+
+
+def test_atomic_write_failure_leaves_nothing(tmp_path):
+    path = str(tmp_path / "file")
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as f:
+            f.write(b'partial')
+            raise RuntimeError()
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, directory=True) as tmp:
+            open(os.path.join(tmp, "partial"), 'w').close()
+            raise RuntimeError()
+    assert os.listdir(tmp_path) == []
+
+
+def test_atomic_write_keeps_existing_directory(tmp_path):
+    path = str(tmp_path / "entry")
+    for content in ('first', 'second'):
+        with atomic_write(path, directory=True) as tmp:
+            with open(os.path.join(tmp, "data"), 'w') as f:
+                f.write(content)
+    with open(os.path.join(path, "data")) as f:
+        assert f.read() == 'first'
+    assert os.listdir(tmp_path) == ["entry"]
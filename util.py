@@ -1,3 +1,7 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
 from time import time
   
 def timefunc(printFunc):
@@ -11,3 +15,36 @@ def timefunc(printFunc):
         return f
     return decorator
 
+
+@contextmanager
+def atomic_write(path, mode='wb', directory=False):
+    """
+    Write to a temporary file next to path and rename it to path once the block succeeds,
+    so that a partial result is never visible to other processes.
+    Yields the open file, or the path of a temporary directory if directory is set.
+    If another process has written the same directory in the meantime, it's kept.
+    """
+    parent = os.path.dirname(path) or "."
+    os.makedirs(parent, exist_ok=True)
+    if directory:
+        tmp = tempfile.mkdtemp(dir=parent)
+        remove = shutil.rmtree
+    else:
+        fd, tmp = tempfile.mkstemp(dir=parent)
+        remove = os.remove
+    try:
+        if directory:
+            yield tmp
+        else:
+            with os.fdopen(fd, mode) as f:
+                yield f
+    except BaseException:
+        remove(tmp)
+        raise
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        remove(tmp)
+        # A non-empty directory can't be replaced, another process has written it
+        if not (directory and os.path.isdir(path)):
+            raise